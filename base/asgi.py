@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
+# настройки соединений по умолчанию для ASGI (см. DB_URL в base/settings.py)
+os.environ.setdefault('BIMA_ASGI', 'True')
 
 application = get_asgi_application()
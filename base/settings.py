@@ -1,7 +1,8 @@
 from pathlib import Path
+import json
 import os
 from datetime import timedelta
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 
 # === BASE DIR ===
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -37,6 +38,9 @@ INSTALLED_APPS = [
 
 # === MIDDLEWARE ===
 MIDDLEWARE = [
+    # первым — чтобы в замер попадали все остальные слои
+    "bima.middleware.MetricsMiddleware",
+    "bima.profiling.ProfilerMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -70,28 +74,91 @@ TEMPLATES = [
 ]
 
 # === DATABASE ===
+# параметры соединений задаются query-параметрами DB_URL:
+#   postgres://u:p@host:5432/db?conn_max_age=300&statement_timeout=5000
+#   postgres://u:p@host:5432/db?pool_max=20&pool_min=2&pool_timeout=10   (psycopg 3 + psycopg_pool)
+#   sqlite:///db.sqlite3?journal_mode=WAL&synchronous=NORMAL&busy_timeout=5000
+# без параметров под WSGI соединение живёт conn_max_age секунд и проверяется перед
+# повторным использованием — вместо нового коннекта на каждый запрос. Под ASGI
+# (BIMA_ASGI ставит base/asgi.py) соединения потоков запроса между запросами не
+# переиспользуются, поэтому по умолчанию conn_max_age=0, а переиспользование — пулом
 DB_URL = os.getenv("DB_URL", f"sqlite:///{BASE_DIR/'db.sqlite3'}")
+BIMA_ASGI = os.getenv("BIMA_ASGI", "False") == "True"
 
-if DB_URL.startswith("sqlite"):
-    DATABASES = {
-        "default": {
+
+def _db_params(url):
+    return {k: v[-1] for k, v in parse_qs(urlparse(url).query).items()}
+
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _database(url):
+    db = _db_params(url)
+    if url.startswith("sqlite"):
+        # WAL: чтение не ждёт запись. Режим хранится в заголовке файла, поэтому
+        # db.sqlite3 в репозитории уже в WAL и PRAGMA его не переписывает
+        pragmas = {
+            "journal_mode": db.get("journal_mode", "WAL"),
+            "synchronous": db.get("synchronous", "NORMAL"),
+            "busy_timeout": db.get("busy_timeout", "5000"),
+            "cache_size": db.get("cache_size", "-20000"),  # отрицательное — в КиБ
+            "temp_store": db.get("temp_store", "MEMORY"),
+            "mmap_size": db.get("mmap_size", str(128 * 1024 * 1024)),
+        }
+        return {
             "ENGINE": "django.db.backends.sqlite3",
-            "NAME": DB_URL.split("sqlite:///")[1],
+            "NAME": url.split("sqlite:///")[1].partition("?")[0],
+            "CONN_MAX_AGE": int(db.get("conn_max_age", "0" if BIMA_ASGI else "600")),
+            "CONN_HEALTH_CHECKS": _flag(db.get("health_checks", "true")),
+            "OPTIONS": {
+                "init_command": "".join(f"PRAGMA {k}={v};" for k, v in pragmas.items()),
+                # запись берёт блокировку сразу — без "database is locked" при апгрейде чтения
+                "transaction_mode": db.get("transaction_mode", "IMMEDIATE"),
+            },
         }
-    }
-else:
-    u = urlparse(DB_URL)
-    DATABASES = {
-        "default": {
-            "ENGINE": "django.db.backends.postgresql",
-            "NAME": u.path.lstrip("/"),
-            "USER": u.username,
-            "PASSWORD": u.password,
-            "HOST": u.hostname,
-            "PORT": u.port or 5432,
+    u = urlparse(url)
+    options = {}
+    if "statement_timeout" in db:
+        options["options"] = f"-c statement_timeout={int(db['statement_timeout'])}"
+    if "connect_timeout" in db:
+        options["connect_timeout"] = int(db["connect_timeout"])
+    if "pool_max" in db:
+        # пул psycopg внутри процесса; с ним CONN_MAX_AGE должен быть 0
+        options["pool"] = {
+            "min_size": int(db.get("pool_min", "1")),
+            "max_size": int(db["pool_max"]),
+            "timeout": float(db.get("pool_timeout", "10")),
         }
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": u.path.lstrip("/"),
+        "USER": u.username,
+        "PASSWORD": u.password,
+        "HOST": u.hostname,
+        "PORT": u.port or 5432,
+        "CONN_MAX_AGE": 0 if "pool" in options else int(db.get("conn_max_age", "0" if BIMA_ASGI else "300")),
+        "CONN_HEALTH_CHECKS": _flag(db.get("health_checks", "true")),
+        "OPTIONS": options,
     }
 
+
+DATABASES = {"default": _database(DB_URL)}
+
+# реплики только для чтения (через запятую, формат как у DB_URL): на них уходят
+# GET list/retrieve, см. bima.replicas
+DB_REPLICA_URLS = [x.strip() for x in os.getenv("DB_REPLICA_URLS", "").split(",") if x.strip()]
+for _i, _url in enumerate(DB_REPLICA_URLS, 1):
+    DATABASES[f"replica{_i}"] = {**_database(_url), "TEST": {"MIRROR": "default"}}
+if DB_REPLICA_URLS:
+    DATABASE_ROUTERS = ["bima.replicas.ReplicaRouter"]
+# сколько секунд после записи пользователь читает с primary (свои же записи
+# могли ещё не доехать до реплики) и в каком кеше это помнится: с репликами он
+# должен быть общим для воркеров (Redis/Memcached), LocMem не пройдёт check bima.E001
+BIMA_REPLICA_PIN_SECONDS = int(os.getenv("BIMA_REPLICA_PIN_SECONDS", "5"))
+BIMA_REPLICA_PIN_CACHE = os.getenv("BIMA_REPLICA_PIN_CACHE", "default")
+
 # === PASSWORD VALIDATORS ===
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -100,6 +167,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# pbkdf2_sha256 с числом итераций из BIMA_PBKDF2_ITERATIONS (пусто — как в Django);
+# хеширование при регистрации — в пуле из BIMA_HASH_WORKERS потоков, сверх
+# BIMA_HASH_QUEUE ожидающих регистрация отвечает 503 (bima.hashers)
+PASSWORD_HASHERS = [
+    "bima.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+_iterations = os.getenv("BIMA_PBKDF2_ITERATIONS", "")
+BIMA_PBKDF2_ITERATIONS = int(_iterations) if _iterations else None
+BIMA_HASH_WORKERS = int(os.getenv("BIMA_HASH_WORKERS", "2"))
+BIMA_HASH_QUEUE = int(os.getenv("BIMA_HASH_QUEUE", "16"))
+
 # === I18N / L10N ===
 LANGUAGE_CODE = "ru-ru"
 TIME_ZONE = "UTC"
@@ -110,19 +192,33 @@ USE_TZ = True
 STATIC_URL = "static/"
 
 # === DRF / OPENAPI ===
+# BIMA_STATELESS_AUTH=True — request.user строится из claims токена без запроса
+# User на каждый запрос (bima.authentication.StatelessJWTAuthentication)
+BIMA_STATELESS_AUTH = os.getenv("BIMA_STATELESS_AUTH", "False") == "True"
+# как долго воркер доверяет закешированным is_active/is_staff пользователя
+BIMA_AUTH_CACHE_SECONDS = int(os.getenv("BIMA_AUTH_CACHE_SECONDS", "60"))
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "bima.authentication.StatelessJWTAuthentication"
+        if BIMA_STATELESS_AUTH
+        else "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "EXCEPTION_HANDLER": "bima.errors.exception_handler_json",
+    # списки — курсорная пагинация по (created_at, id), см. bima.pagination
+    "DEFAULT_PAGINATION_CLASS": "bima.pagination.KeysetPagination",
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", "50")),
     
+    # создание расчётов (в т.ч. пакетом) и заявок — на пользователя, регистрация —
+    # на IP; тарифы брокеров переопределяют их в BIMA_THROTTLE_TIERS (bima.throttling)
     "DEFAULT_THROTTLE_RATES": {
-        "anon": "30/min",
-        "user": "120/min",
+        "quotes": os.getenv("THROTTLE_QUOTES", "120/min"),
+        "applications": os.getenv("THROTTLE_APPLICATIONS", "30/min"),
+        "register": os.getenv("THROTTLE_REGISTER", "10/min"),
     },
 }
 
@@ -138,6 +234,65 @@ SECURE_REFERRER_POLICY = "same-origin"
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = "DENY"
 
+# === BIMA ===
+# как часто воркер сверяет версию тарифных правил (bima.Ruleset) с БД
+BIMA_RULESET_RELOAD_SECONDS = int(os.getenv("BIMA_RULESET_RELOAD_SECONDS", "30"))
+# фоновая чистка просроченных расчётов/заявок внутри воркера; 0 — выключено
+# (тогда запускать manage.py expire_quotes по cron)
+BIMA_EXPIRY_INTERVAL_SECONDS = int(os.getenv("BIMA_EXPIRY_INTERVAL_SECONDS", "0"))
+# сколько дней хранить USED/EXPIRED расчёты без заявки; пусто — не удалять
+_retention = os.getenv("BIMA_QUOTE_RETENTION_DAYS", "")
+BIMA_QUOTE_RETENTION_DAYS = int(_retention) if _retention else None
+# через сколько дней NEW заявка переводится в EXPIRED; пусто — не переводить
+_application_ttl = os.getenv("BIMA_APPLICATION_TTL_DAYS", "")
+BIMA_APPLICATION_TTL_DAYS = int(_application_ttl) if _application_ttl else None
+# кеш с блокировкой фоновой чистки: за интервал чистит один воркер. Блокировка
+# действует между процессами только в общем кеше (Redis/Memcached)
+BIMA_EXPIRY_LOCK_CACHE = os.getenv("BIMA_EXPIRY_LOCK_CACHE", "default")
+
+# Idempotency-Key для POST /quotes/ и /applications/: где хранить ответы и сколько.
+# При нескольких воркерах кеш должен быть общим (CACHES с Redis/Memcached)
+BIMA_IDEMPOTENCY_CACHE = os.getenv("BIMA_IDEMPOTENCY_CACHE", "default")
+BIMA_IDEMPOTENCY_TTL = int(os.getenv("BIMA_IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+BIMA_IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("BIMA_IDEMPOTENCY_WAIT_SECONDS", "5"))
+
+# ETag для GET /quotes/{id}/ и /applications/{id}/: кеш с актуальными ETag и их TTL.
+# Изменения сбрасывают ETag только в кеше своего процесса, поэтому при нескольких
+# воркерах нужен общий кеш; в LocMem записи живут не дольше etags.LOCAL_TTL секунд
+BIMA_ETAG_CACHE = os.getenv("BIMA_ETAG_CACHE", "default")
+BIMA_ETAG_TTL = int(os.getenv("BIMA_ETAG_TTL", "300"))
+
+# счётчики лимитов: "" — в памяти процесса (один узел), иначе алиас CACHES с общим
+# хранилищем (Redis/Memcached); если оно недоступно — снова память процесса
+BIMA_THROTTLE_CACHE = os.getenv("BIMA_THROTTLE_CACHE", "")
+# лимиты тарифов брокеров, JSON: {"broker": {"quotes": "1200/min", "applications": "300/min"}};
+# тариф пользователя — его группа с тем же именем, попадает в токен claim-ом tier
+BIMA_THROTTLE_TIERS = json.loads(os.getenv("BIMA_THROTTLE_TIERS", "{}"))
+
+# запросы дольше порога пишутся в лог bima.slow вместе с SQL
+BIMA_SLOW_REQUEST_MS = int(os.getenv("BIMA_SLOW_REQUEST_MS", "500"))
+# токен для сбора /api/v1/metrics без JWT (заголовок X-Metrics-Token); пусто — только staff
+BIMA_METRICS_TOKEN = os.getenv("BIMA_METRICS_TOKEN", "")
+
+# профилирование отдельных запросов staff-пользователями (X-Profile: 1 / ?_profile=1);
+# выключено — middleware не участвует в обработке вовсе
+BIMA_PROFILING = os.getenv("BIMA_PROFILING", "False") == "True"
+BIMA_PROFILE_MIN_INTERVAL = float(os.getenv("BIMA_PROFILE_MIN_INTERVAL", "10"))
+BIMA_PROFILE_KEEP = int(os.getenv("BIMA_PROFILE_KEEP", "100"))
+# под ASGI — создание/список/просмотр расчётов, preview и создание заявки
+# обслуживают нативные async view (bima.async_views) вместо DRF viewset
+BIMA_ASYNC_API = os.getenv("BIMA_ASYNC_API", "False") == "True"
+# строк на один fetch при выгрузке /export и manage.py export_bima
+BIMA_EXPORT_CHUNK_SIZE = int(os.getenv("BIMA_EXPORT_CHUNK_SIZE", "2000"))
+
+# лента /api/v1/applications/events (только ASGI): как часто процесс читает новые
+# события из БД (изменения из других процессов), предельное ожидание long-poll,
+# интервал keep-alive в SSE и сколько дней хранить события
+BIMA_EVENTS_POLL_SECONDS = float(os.getenv("BIMA_EVENTS_POLL_SECONDS", "1"))
+BIMA_EVENTS_LONGPOLL_SECONDS = int(os.getenv("BIMA_EVENTS_LONGPOLL_SECONDS", "25"))
+BIMA_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("BIMA_EVENTS_HEARTBEAT_SECONDS", "15"))
+BIMA_EVENT_RETENTION_DAYS = int(os.getenv("BIMA_EVENT_RETENTION_DAYS", "7"))
+
 # === JWT ===
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(
@@ -146,4 +301,5 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(
         days=int(os.getenv("REFRESH_TOKEN_LIFETIME_DAYS", "7"))
     ),
+    "TOKEN_OBTAIN_SERIALIZER": "bima.authentication.ClaimsTokenObtainPairSerializer",
 }
@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from bima.views import QuoteViewSet, ApplicationViewSet , RegisterView
+from bima.async_views import application_events
+from bima.views import QuoteViewSet, ApplicationViewSet , RegisterView, MetricsView, ExportView, SimulateView, SummaryView
 
 router = DefaultRouter()
 router.register("quotes", QuoteViewSet, basename="quotes")
@@ -16,5 +18,23 @@ urlpatterns = [
     path("api/v1/auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/v1/auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/v1/auth/register/", RegisterView.as_view(), name="register"),
+    path("api/v1/summary/", SummaryView.as_view(), name="summary"),
+    path("api/v1/metrics", MetricsView.as_view(), name="metrics"),
+    path("api/v1/quotes/export", ExportView.as_view(kind="quotes"), name="quotes-export"),
+    path("api/v1/quotes/simulate", SimulateView.as_view(), name="quotes-simulate"),
+    path("api/v1/applications/events", application_events, name="applications-events"),
+    path("api/v1/applications/export", ExportView.as_view(kind="applications"), name="applications-export"),
     path("api/v1/", include(router.urls)),
 ]
+
+if settings.BIMA_ASYNC_API:
+    from bima import async_views
+
+    # те же пути и имена, что у router; стоят раньше него и перехватывают запросы
+    urlpatterns.insert(0, path("api/v1/auth/register/", async_views.register, name="register"))
+    urlpatterns[-1:-1] = [
+        path("api/v1/quotes/", async_views.quotes, name="quotes-list"),
+        path("api/v1/quotes/preview/", async_views.quote_preview, name="quotes-preview"),
+        path("api/v1/quotes/<uuid:pk>/", async_views.quote_detail, name="quotes-detail"),
+        path("api/v1/applications/", async_views.applications, name="applications-list"),
+    ]
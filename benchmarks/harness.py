@@ -0,0 +1,96 @@
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+
+def setup_django(db_url=None):
+    # отдельная тестовая БД: рабочую db.sqlite3 бенчмарки не трогают
+    if db_url:
+        os.environ["DB_URL"] = db_url
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "base.settings")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import django
+
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    return connection
+
+
+def teardown_django(connection):
+    connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+def summarize(samples_ns, queries=None):
+    # samples_ns — длительности отдельных вызовов в наносекундах
+    samples = sorted(samples_ns)
+    total_s = sum(samples) / 1e9
+    q = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    result = {
+        "n": len(samples),
+        "p50_us": round(q[49] / 1e3, 2),
+        "p95_us": round(q[94] / 1e3, 2),
+        "p99_us": round(q[98] / 1e3, 2),
+        "ops_per_s": round(len(samples) / total_s, 1) if total_s else None,
+    }
+    if queries is not None:
+        result["queries_per_op"] = round(sum(queries) / len(queries), 2)
+    return result
+
+
+def measure(fn, n, warmup=None):
+    for _ in range(warmup if warmup is not None else max(n // 10, 1)):
+        fn()
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(n):
+        started = clock()
+        fn()
+        samples.append(clock() - started)
+    return summarize(samples)
+
+
+def load_baseline(path=BASELINE):
+    if not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text())
+
+
+def save_baseline(results, path=BASELINE):
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True, ensure_ascii=False) + "\n")
+
+
+def compare(results, baseline, tolerance, min_delta_us=2.0):
+    # регрессия: p50 медленнее базы больше чем в tolerance раз (и больше чем
+    # на min_delta_us — субмикросекундные замеры шумят) или запросов к БД
+    # на операцию стало больше
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        slower = current["p50_us"] - base["p50_us"]
+        if current["p50_us"] > base["p50_us"] * tolerance and slower > min_delta_us:
+            regressions.append(f"{name}: p50 {current['p50_us']} мкс > {base['p50_us']} × {tolerance}")
+        if current.get("queries_per_op", 0) > base.get("queries_per_op", float("inf")):
+            regressions.append(
+                f"{name}: запросов на операцию {current['queries_per_op']} > {base['queries_per_op']}"
+            )
+    return regressions
+
+
+def print_table(results, out=sys.stdout):
+    out.write(f"{'benchmark':48} {'p50 мкс':>10} {'p95 мкс':>10} {'p99 мкс':>10} {'ops/s':>10} {'q/op':>6}\n")
+    for name, r in sorted(results.items()):
+        out.write(
+            f"{name:48} {r['p50_us']:>10} {r['p95_us']:>10} {r['p99_us']:>10} "
+            f"{r['ops_per_s'] or '-':>10} {r.get('queries_per_op', '-'):>6}\n"
+        )
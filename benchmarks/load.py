@@ -0,0 +1,120 @@
+import itertools
+import time
+
+from .harness import summarize
+
+
+def _client_for(username):
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+    from bima.authentication import ClaimsRefreshToken
+
+    user = get_user_model().objects.create_user(username, password="bench-password")
+    token = ClaimsRefreshToken.for_user(user).access_token
+    return user, Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+
+def _drive(client, requests, connection):
+    # requests — итератор (method, path, payload, expected_status)
+    count = [0]
+
+    def counter(execute, sql, params, many, context):
+        count[0] += 1
+        return execute(sql, params, many, context)
+
+    samples, queries = [], []
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        for method, path, payload, expected in requests:
+            count[0] = 0
+            t0 = time.perf_counter_ns()
+            if method == "get":
+                response = client.get(path, payload)
+            else:
+                response = client.post(path, payload, content_type="application/json")
+            samples.append(time.perf_counter_ns() - t0)
+            queries.append(count[0])
+            if response.status_code != expected:
+                raise AssertionError(f"{method.upper()} {path}: {response.status_code} {response.content[:200]!r}")
+    result = summarize(samples, queries)
+    result["ops_per_s"] = round(len(samples) / (time.perf_counter() - started), 1)
+    return result
+
+
+def run(connection, scale=1.0):
+    from django.conf import settings
+    from django.test import override_settings
+
+    # лимиты bima.throttling остаются включёнными (их цена входит в замеры), но
+    # такими, чтобы прогон в них не упирался
+    rates = {scope: "1000000/s" for scope in settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]}
+    with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}):
+        return _run(connection, scale)
+
+
+def _run(connection, scale):
+    from bima.models import Quote
+
+    n = max(int(500 * scale), 20)
+    vendor = connection.vendor
+    _, client = _client_for(f"bench-{vendor}")
+    payloads = itertools.cycle([
+        {"tariff": tariff, "driver_age": age, "driver_experience": exp, "car_type": car}
+        for tariff in ("OSAGO", "KASKO")
+        for age, exp in ((19, 0), (24, 2), (40, 15))
+        for car in ("sedan", "suv", "truck", "sport")
+    ])
+    results = {}
+
+    results[f"load.{vendor}.quotes_create"] = _drive(
+        client, (("post", "/api/v1/quotes/", next(payloads), 201) for _ in range(n)), connection
+    )
+    # id созданных расчётов нужны для retrieve и заявок
+    tariffs = dict(Quote.objects.values_list("pk", "tariff")[:n])
+
+    results[f"load.{vendor}.quotes_preview"] = _drive(
+        client, (("get", "/api/v1/quotes/preview/", next(payloads), 200) for _ in range(n)), connection
+    )
+    results[f"load.{vendor}.quotes_list"] = _drive(
+        client, (("get", "/api/v1/quotes/", {}, 200) for _ in range(n // 5)), connection
+    )
+    results[f"load.{vendor}.quotes_retrieve"] = _drive(
+        client, (("get", f"/api/v1/quotes/{pk}/", {}, 200) for pk in tariffs), connection
+    )
+
+    application = {"full_name": "Bench", "phone": "+992900000000", "email": "bench@example.com"}
+    results[f"load.{vendor}.applications_create"] = _drive(
+        client,
+        (
+            ("post", "/api/v1/applications/", {**application, "quote": str(pk), "tariff": tariff}, 201)
+            for pk, tariff in tariffs.items()
+        ),
+        connection,
+    )
+    results[f"load.{vendor}.applications_list"] = _drive(
+        client, (("get", "/api/v1/applications/", {}, 200) for _ in range(n // 5)), connection
+    )
+    results[f"load.{vendor}.applications_list_500"] = _drive(
+        client,
+        (("get", "/api/v1/applications/", {"page_size": 500}, 200) for _ in range(max(n // 25, 4))),
+        connection,
+    )
+    results[f"load.{vendor}.summary"] = _drive(
+        client, (("get", "/api/v1/summary/", {}, 200) for _ in range(n // 5)), connection
+    )
+
+    # регистрация упирается в PBKDF2 (BIMA_PBKDF2_ITERATIONS): один клиент —
+    # одно ядро, ops_per_s здесь и есть регистраций в секунду на ядро
+    from django.test import Client
+
+    signups = max(int(20 * scale), 5)
+    results[f"load.{vendor}.signup"] = _drive(
+        Client(),
+        (
+            ("post", "/api/v1/auth/register/",
+             {"username": f"bench-signup-{vendor}-{i}", "email": f"signup{i}@example.com", "password": "bench-password"}, 201)
+            for i in range(signups)
+        ),
+        connection,
+    )
+    return results
@@ -0,0 +1,88 @@
+import itertools
+
+
+def run(scale=1.0):
+    from bima.models import Quote, Application
+    from bima.pricing import get_engine
+    from bima.serializer import (
+        QuoteCreateSerializer, QuoteDetailSerializer, QuoteListSerializer, ApplicationDetailSerializer,
+        _preview_data, preview_data,
+    )
+    from bima.utils import BASE_PRICES, AGE_RANGES, EXP_RANGES, CAR_COEF, pick_from_ranges
+
+    from .harness import measure
+
+    n = max(int(20_000 * scale), 100)
+    engine = get_engine()
+    inputs = itertools.cycle([
+        (tariff, age, exp, car)
+        for tariff in BASE_PRICES
+        for age, exp in ((19, 0), (24, 2), (40, 15), (70, 40))
+        for car in CAR_COEF
+    ])
+
+    def legacy_price():
+        # расчёт как до PricingEngine — для сравнения
+        tariff, age, exp, car = next(inputs)
+        base = float(BASE_PRICES[tariff])
+        return round(
+            base * pick_from_ranges(age, AGE_RANGES) * pick_from_ranges(exp, EXP_RANGES) * CAR_COEF[car], 2
+        )
+
+    results = {
+        "pricing.engine_price": measure(lambda: engine.price(*next(inputs)), n),
+        "pricing.legacy_pick_from_ranges": measure(legacy_price, n),
+    }
+
+    payload = {"tariff": "OSAGO", "driver_age": 24, "driver_experience": 2, "car_type": "suv"}
+    _preview_data.cache_clear()
+    results["pricing.preview_cached"] = measure(lambda: preview_data(payload), n)
+
+    def validate():
+        s = QuoteCreateSerializer(data=payload)
+        s.is_valid(raise_exception=True)
+
+    n_ser = max(n // 10, 100)
+    results["serializer.quote_create_validate"] = measure(validate, n_ser)
+
+    calc = engine.price("OSAGO", 24, 2, "suv")
+    from django.utils import timezone
+    now = timezone.now()
+    quote = Quote(
+        user_id=1, **payload, base_amount=calc.base, coef_age=calc.c_age, coef_exp=calc.c_exp,
+        coef_car=calc.c_car, total_amount=calc.total, valid_until=now, created_at=now,
+    )
+    results["serializer.quote_detail_to_representation"] = measure(
+        lambda: QuoteDetailSerializer(quote).data, n_ser
+    )
+    quotes = [quote] * 100
+    results["serializer.quote_detail_many_100"] = measure(
+        lambda: QuoteDetailSerializer(quotes, many=True).data, max(n_ser // 50, 20)
+    )
+    # тот же список строками values(), как отдаёт GET /quotes/
+    row = {QuoteListSerializer.row_sources.get(name, name): getattr(quote, name) for name in QuoteListSerializer.Meta.fields}
+    rows = [row] * 100
+    results["serializer.quote_list_rows_100"] = measure(
+        lambda: QuoteListSerializer(rows, many=True).data, max(n_ser // 50, 20)
+    )
+
+    from django.contrib.auth import get_user_model
+    app = Application(
+        user=get_user_model()(id=1, username="bench"), quote=quote, full_name="Bench",
+        phone="+992900000000", email="bench@example.com", tariff="OSAGO",
+        total_amount_snapshot=calc.total, created_at=now, updated_at=now,
+    )
+    results["serializer.application_detail_to_representation"] = measure(
+        lambda: ApplicationDetailSerializer(app).data, n_ser
+    )
+
+    # цена лимита на запрос: счётчики в памяти процесса и в кеше (LocMem вместо Redis)
+    import time
+    from bima.throttling import CacheBackend, LocalBackend
+
+    keys = itertools.cycle([f"quotes:u{i}" for i in range(1000)])
+    local = LocalBackend()
+    results["throttle.local_hit"] = measure(lambda: local.hit(next(keys), 10**9, 60, time.time()), n)
+    shared = CacheBackend("default", local)
+    results["throttle.cache_hit"] = measure(lambda: shared.hit(next(keys), 10**9, 60, time.time()), n)
+    return results
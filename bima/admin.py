@@ -1,13 +1,103 @@
 # core/admin.py
 from django.contrib import admin
-from .models import Quote, Application
+from django.utils.html import format_html
+from . import etags, events, rollup
+from .models import Quote, QuoteFactors, Application, Ruleset, RequestProfile
+
+
+class RollupAdminMixin:
+    # правки и удаление через админку переносят счётчики сводки (bima/rollup.py)
+    # и сбрасывают ETag (bima/etags.py); changeform/delete в админке уже идут в транзакции
+    rollup_kind = None
+
+    def _row(self, obj):
+        return tuple(getattr(obj, name) for name in rollup.ROW_FIELDS[self.rollup_kind])
+
+    def save_model(self, request, obj, form, change):
+        fields = rollup.ROW_FIELDS[self.rollup_kind]
+        old = type(obj).objects.filter(pk=obj.pk).values_list(*fields).first() if change else None
+        super().save_model(request, obj, form, change)
+        new = self._row(obj)
+        if change:
+            etags.invalidate(self.rollup_kind, [(obj.user_id, obj.pk)])
+        if old != new:
+            if old:
+                rollup.removed(self.rollup_kind, [old])
+            rollup.added(self.rollup_kind, [new])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rollup.removed(self.rollup_kind, [self._row(obj)])
+        etags.invalidate(self.rollup_kind, [(obj.user_id, obj.pk)])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list("pk", *rollup.ROW_FIELDS[self.rollup_kind]))
+        super().delete_queryset(request, queryset)
+        rollup.removed(self.rollup_kind, [row[1:] for row in rows])
+        etags.invalidate(self.rollup_kind, [(row[1], row[0]) for row in rows])
+
 
 @admin.register(Quote)
-class QuoteAdmin(admin.ModelAdmin):
+class QuoteAdmin(RollupAdminMixin, admin.ModelAdmin):
+    rollup_kind = rollup.QUOTE
     list_display = ("id","user","tariff","total_amount","status","valid_until","created_at")
     list_filter = ("tariff","status","created_at")
+    # база/коэффициенты расчёта — общая строка QuoteFactors, её не перевешивают;
+    # без них расчёт не создать, поэтому новые расчёты — только через API
+    readonly_fields = ("factors",)
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(QuoteFactors)
+class QuoteFactorsAdmin(admin.ModelAdmin):
+    # строки создаются расчётами и не меняются: на них ссылаются Quote
+    list_display = ("id","ruleset_version","currency","base_amount","coef_age","coef_exp","coef_car")
+    list_filter = ("ruleset_version",)
+    readonly_fields = ("ruleset_version","currency","base_amount","coef_age","coef_exp","coef_car")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(Application)
-class ApplicationAdmin(admin.ModelAdmin):
+class ApplicationAdmin(RollupAdminMixin, admin.ModelAdmin):
+    rollup_kind = rollup.APPLICATION
     list_display = ("id","user","tariff","total_amount_snapshot","status","created_at")
     list_filter = ("tariff","status","created_at")
+
+    def save_model(self, request, obj, form, change):
+        # смена статуса уходит в ленту /applications/events владельца заявки
+        old = Application.objects.filter(pk=obj.pk).values_list("status", flat=True).first() if change else None
+        super().save_model(request, obj, form, change)
+        if obj.status != old:
+            events.record([(obj.user_id, obj.pk, obj.status)])
+
+@admin.register(Ruleset)
+class RulesetAdmin(admin.ModelAdmin):
+    list_display = ("version","effective_from","currency","revision","updated_at")
+    readonly_fields = ("revision","updated_at")
+    search_fields = ("version",)
+
+    def get_readonly_fields(self, request, obj=None):
+        # у сохранённой версии меняется только effective_from (см. Ruleset.RULE_FIELDS)
+        if obj is None:
+            return self.readonly_fields
+        return (*self.readonly_fields, *Ruleset.RULE_FIELDS)
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ("id","method","path","status_code","duration_ms","user","created_at")
+    list_filter = ("method","status_code")
+    search_fields = ("path",)
+    fields = ("method","path","status_code","duration_ms","user","created_at","report_pre")
+    readonly_fields = fields
+
+    @admin.display(description="report")
+    def report_pre(self, obj):
+        return format_html("<pre>{}</pre>", obj.report)
+
+    def has_add_permission(self, request):
+        return False
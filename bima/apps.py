@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+
+
+def _start_expiry_scheduler(**kwargs):
+    from .expiry import start_scheduler
+
+    start_scheduler(settings.BIMA_EXPIRY_INTERVAL_SECONDS, settings.BIMA_QUOTE_RETENTION_DAYS)
 
 
 class BimaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bima'
+
+    def ready(self):
+        from . import checks  # noqa: F401 — регистрация system checks
+
+        # планировщик поднимается на первом запросе, а не при импорте —
+        # чтобы migrate и прочие команды не запускали фоновый поток
+        if settings.BIMA_EXPIRY_INTERVAL_SECONDS > 0:
+            request_started.connect(_start_expiry_scheduler, dispatch_uid="bima-expiry")
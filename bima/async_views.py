@@ -0,0 +1,255 @@
+"""Нативные async view для горячих эндпоинтов (включаются BIMA_ASYNC_API=True).
+
+Под ASGI DRF-view выполняются в одном потоке sync_to_async, и каждый запрос
+к /quotes/ занимает его целиком. Здесь создание/список/просмотр расчёта,
+preview, создание заявки и регистрация работают в event loop через async ORM; формат
+ответов и ошибок тот же, что у QuoteViewSet/ApplicationViewSet. Всё, что
+здесь не реализовано (остальные методы, запросы с Idempotency-Key),
+передаётся в синхронный viewset.
+
+Лента событий заявок (application_events) есть только здесь и работает при
+любом BIMA_ASYNC_API, но только под ASGI.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import etags, events, hashers, throttling
+from .authentication import aauthenticate
+from .errors import AsgiRequired, exception_handler_json
+from .filters import apply_list_filters
+from .idempotency import HEADER as IDEMPOTENCY_HEADER
+from .models import Quote
+from .pagination import KeysetPagination
+from .pricing import aget_engine
+from .replicas import DEFAULT_DB, ais_pinned, apin_primary, pick_replica, read_from, replica_aliases
+from .serializer import (
+    QuoteCreateSerializer, QuoteDetailSerializer, QuoteListSerializer, QuotePreviewSerializer, build_quote, preview_data,
+    QuoteFilterSerializer, ApplicationCreateSerializer, check_quote, create_application, save_quotes,
+    RegisterSerializer, insert_user, new_user,
+)
+from .views import QuoteViewSet, ApplicationViewSet, ApplicationEventsView, RegisterView, registration_data
+
+_renderer = JSONRenderer()
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), status=status_code, content_type="application/json")
+
+
+def _error(exc, request):
+    if isinstance(exc, Http404):
+        exc = exceptions.NotFound()
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # как APIView.handle_exception: 401 с WWW-Authenticate
+        exc.auth_header = JWTAuthentication().authenticate_header(request)
+    response = exception_handler_json(exc, {"request": request})
+    error = _json(response.data, response.status_code)
+    for name, value in response.headers.items():
+        if name != "Content-Type":
+            error[name] = value
+    return error
+
+
+def native(methods, fallback, anonymous=False):
+    """Async-обработчик для methods; остальное — в синхронный DRF-view fallback."""
+    fallback = sync_to_async(fallback)
+
+    def decorator(handler):
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method not in methods or IDEMPOTENCY_HEADER in request.headers:
+                return await fallback(request, *args, **kwargs)
+            drf_request = Request(request, parsers=[JSONParser()])
+            try:
+                user, drf_request.auth = await aauthenticate(drf_request) or (None, None)
+                if user is None and not anonymous:
+                    raise exceptions.NotAuthenticated()
+                drf_request.user = user or AnonymousUser()
+                return await handler(drf_request, *args, **kwargs)
+            except (exceptions.APIException, Http404) as exc:
+                return _error(exc, drf_request)
+        return view
+    return decorator
+
+
+async def _reader(request):
+    # как ReplicaReadMixin: реплика, если пользователь недавно не писал
+    if replica_aliases() and not await ais_pinned(request.user.pk):
+        return pick_replica()
+    return DEFAULT_DB
+
+
+async def _page(request, queryset, serializer_class):
+    paginator = KeysetPagination()
+    window, page_size = paginator.window(queryset, request)
+    rows = paginator.page([row async for row in window], page_size)
+    return _json(paginator.get_paginated_data(serializer_class(rows, many=True).data))
+
+
+@native({"GET", "POST"}, QuoteViewSet.as_view({"get": "list", "post": "create"}))
+async def quotes(request):
+    if request.method == "GET":
+        queryset = Quote.objects.filter(user_id=request.user.id).order_by("-created_at", "-id")
+        queryset = apply_list_filters(queryset, request.query_params, QuoteFilterSerializer)
+        with read_from(await _reader(request)):
+            return await _page(request, QuoteListSerializer.values(queryset), QuoteListSerializer)
+    await throttling.acheck(request, throttling.QUOTES)
+    serializer = QuoteCreateSerializer(data=request.data, context={"request": request})
+    serializer.is_valid(raise_exception=True)
+    quote = build_quote(request.user.id, serializer.validated_data, await aget_engine())
+    # вставка и счётчики сводки — одна транзакция, а транзакций в async ORM нет
+    await sync_to_async(save_quotes)([quote])
+    await apin_primary(request.user.pk)
+    return _json(QuoteCreateSerializer(quote).data, status.HTTP_201_CREATED)
+
+
+@native({"GET"}, QuoteViewSet.as_view({"get": "retrieve"}))
+async def quote_detail(request, pk):
+    response = await etags.acached_response(etags.QUOTE, request, pk)
+    if response is not None:
+        return response
+    with read_from(await _reader(request)):
+        # factors — тем же запросом: ленивое чтение QuoteFactors в event loop запрещено
+        quote = await Quote.objects.select_related("factors").filter(user_id=request.user.id, pk=pk).afirst()
+    if quote is None:
+        raise Http404
+    etag = await etags.aremember(etags.QUOTE, request.user.id, quote)
+    if etags.matches(request.headers.get("If-None-Match"), etag):
+        return etags.not_modified(etag)
+    response = _json(QuoteDetailSerializer(quote).data)
+    response["ETag"] = etag
+    return response
+
+
+@native({"GET"}, QuoteViewSet.as_view({"get": "preview"}))
+async def quote_preview(request):
+    serializer = QuotePreviewSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return _json(preview_data(serializer.validated_data, await aget_engine()))
+
+
+class _ApplicationInputSerializer(ApplicationCreateSerializer):
+    # quote проверяется отдельно через async ORM: PrimaryKeyRelatedField ходит в БД синхронно
+    quote = serializers.CharField()
+
+    def validate(self, data):
+        return data
+
+
+@native({"POST"}, ApplicationViewSet.as_view({"get": "list", "post": "create"}))
+async def applications(request):
+    await throttling.acheck(request, throttling.APPLICATIONS)
+    serializer = _ApplicationInputSerializer(data=request.data, context={"request": request})
+    serializer.is_valid(raise_exception=True)
+    validated = serializer.validated_data
+    try:
+        quote = await Quote.objects.filter(pk=Quote._meta.pk.to_python(validated["quote"])).afirst()
+    except DjangoValidationError:
+        quote = None
+    if quote is None:
+        message = serializers.PrimaryKeyRelatedField.default_error_messages["does_not_exist"]
+        raise exceptions.ValidationError({"quote": [str(message).format(pk_value=validated["quote"])]})
+    check_quote(quote, request.user.id)
+    # условный UPDATE + INSERT — одна транзакция, а транзакции в async ORM нет
+    app = await sync_to_async(create_application)(request.user.id, {**validated, "quote": quote})
+    await apin_primary(request.user.pk)
+    return _json(ApplicationCreateSerializer(app).data, status.HTTP_201_CREATED)
+
+
+
+@native({"POST"}, RegisterView.as_view(), anonymous=True)
+async def register(request):
+    # хеш пароля считается в пуле bima.hashers, а не в общем потоке sync_to_async
+    await throttling.acheck(request, throttling.REGISTER)
+    serializer = RegisterSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    password_hash = await hashers.ahash_password(serializer.validated_data["password"])
+    user = await sync_to_async(insert_user)(new_user(serializer.validated_data, password_hash))
+    return _json(registration_data(user), status.HTTP_201_CREATED)
+
+class _EventsQuerySerializer(serializers.Serializer):
+    last_event_id = serializers.IntegerField(min_value=0, required=False)
+    timeout = serializers.IntegerField(min_value=0, required=False)
+
+
+SSE_RETRY_MS = 3000  # через сколько браузер переподключается после обрыва
+
+
+def _sse(event):
+    return f"id: {event['id']}\nevent: status\ndata: {_renderer.render(event).decode()}\n\n"
+
+
+async def _event_stream(user_id, cursor):
+    # SSE: сначала пропущенное после cursor, дальше — события из подписки;
+    # подписка живёт ровно столько, сколько соединение (отключение отменяет генератор)
+    subscription, head = await events.hub.subscribe(user_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        sent = set()  # id из догрузки: событие из «дыры» может прийти и подпиской
+        after = head if cursor is None else cursor
+        while after < head:
+            found = await events.backlog(user_id, after, head)
+            for event in found:
+                sent.add(event["id"])
+                yield _sse(event)
+            if len(found) < events.FETCH_LIMIT:
+                break
+            after = found[-1]["id"]
+        while True:
+            found = await subscription.wait(settings.BIMA_EVENTS_HEARTBEAT_SECONDS)
+            if not found:
+                yield ": ping\n\n"
+            for event in found:
+                if event["id"] not in sent:
+                    yield _sse(event)
+    finally:
+        events.hub.unsubscribe(subscription)
+
+
+@native({"GET"}, ApplicationEventsView.as_view())
+async def application_events(request):
+    # смены статуса своих заявок: SSE (Accept: text/event-stream) или long-poll (JSON);
+    # курсор — Last-Event-ID или ?last_event_id=, без него — только новые события
+    if not isinstance(request._request, ASGIRequest):
+        raise AsgiRequired()
+    params = _EventsQuerySerializer(data={
+        **request.query_params.dict(),
+        **({"last_event_id": request.headers["Last-Event-ID"]} if "Last-Event-ID" in request.headers else {}),
+    })
+    params.is_valid(raise_exception=True)
+    cursor = params.validated_data.get("last_event_id")
+    user_id = request.user.id
+
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        response = StreamingHttpResponse(_event_stream(user_id, cursor), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # nginx не должен буферизовать поток
+        return response
+
+    timeout = min(params.validated_data.get("timeout", settings.BIMA_EVENTS_LONGPOLL_SECONDS),
+                  settings.BIMA_EVENTS_LONGPOLL_SECONDS)
+    subscription, head = await events.hub.subscribe(user_id)
+    try:
+        cursor = head if cursor is None else cursor
+        found = await events.backlog(user_id, cursor, head)
+        # догрузка упорядочена и обрезана FETCH_LIMIT — курсор по её последнему событию
+        last = found[-1]["id"] if found else max(cursor, head)
+        if not found:
+            found = await subscription.wait(timeout)
+            last = max([last] + [event["id"] for event in found])
+    finally:
+        events.hub.unsubscribe(subscription)
+    return _json({"events": found, "last_event_id": last})
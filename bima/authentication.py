@@ -0,0 +1,116 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .throttling import user_tier
+
+_MAX_ENTRIES = 10_000
+_account_flags_cache = {}  # user_id -> (is_active, is_staff, expires_at)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    # username кладём в токен, чтобы TokenUser мог отдать его без запроса к БД,
+    # tier — тариф брокера для лимитов bima.throttling; access-токен наследует
+    # claims от refresh, так что новый тариф действует со следующего логина
+    @classmethod
+    def for_user(cls, user, tier=None):
+        token = super().for_user(user)
+        token["username"] = user.get_username()
+        token["tier"] = tier or user_tier(user)
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+def _cached_flags(user_id):
+    hit = _account_flags_cache.get(user_id)
+    if hit is not None and hit[2] > time.monotonic():
+        return hit[0], hit[1]
+    return None
+
+
+def _store_flags(user_id, row):
+    is_active, is_staff = row or (False, False)
+    if len(_account_flags_cache) >= _MAX_ENTRIES:
+        _account_flags_cache.clear()
+    _account_flags_cache[user_id] = (is_active, is_staff, time.monotonic() + settings.BIMA_AUTH_CACHE_SECONDS)
+    return is_active, is_staff
+
+
+def _flags_query(user_id):
+    return get_user_model().objects.filter(pk=user_id).values_list("is_active", "is_staff")
+
+
+def _account_flags(user_id):
+    # (is_active, is_staff) из БД не чаще раза в BIMA_AUTH_CACHE_SECONDS на пользователя:
+    # так блокировка или удаление пользователя доходит до воркера за TTL
+    flags = _cached_flags(user_id)
+    if flags is None:
+        flags = _store_flags(user_id, _flags_query(user_id).first())
+    return flags
+
+
+async def _aaccount_flags(user_id):
+    flags = _cached_flags(user_id)
+    if flags is None:
+        flags = _store_flags(user_id, await _flags_query(user_id).afirst())
+    return flags
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWT без загрузки User на каждый запрос.
+
+    request.user — TokenUser из claims токена (id, username); is_active и
+    is_staff берутся из небольшого TTL-кеша в памяти воркера.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        # simplejwt кладёт user_id в токен строкой — приводим к типу pk,
+        # чтобы сравнения вида quote.user_id == user.id работали как с User
+        user.id = user.pk = get_user_model()._meta.pk.to_python(user.id)
+        is_active, is_staff = _account_flags(user.id)
+        if not is_active:
+            raise AuthenticationFailed("Пользователь неактивен или удалён.", code="user_inactive")
+        user.is_staff = is_staff
+        return user
+
+
+async def aauthenticate(request):
+    """Аутентификация по Bearer-токену для async view (bima.async_views).
+
+    Тот же результат, что у DEFAULT_AUTHENTICATION_CLASSES, но пользователь
+    (или его флаги в режиме BIMA_STATELESS_AUTH) читается через async ORM.
+    Возвращает (user, token), как BaseAuthentication.authenticate, или None,
+    если заголовка Authorization нет.
+    """
+    auth = StatelessJWTAuthentication() if settings.BIMA_STATELESS_AUTH else JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = header and auth.get_raw_token(header)
+    if raw_token is None:
+        return None
+    token = auth.get_validated_token(raw_token)
+    if settings.BIMA_STATELESS_AUTH:
+        user = JWTStatelessUserAuthentication.get_user(auth, token)
+        user.id = user.pk = get_user_model()._meta.pk.to_python(user.id)
+        is_active, user.is_staff = await _aaccount_flags(user.id)
+    else:
+        try:
+            user_id = token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Токен не содержит идентификатор пользователя.")
+        user = await get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None:
+            raise AuthenticationFailed("Пользователь не найден.", code="user_not_found")
+        is_active = user.is_active
+    if not is_active:
+        raise AuthenticationFailed("Пользователь неактивен или удалён.", code="user_inactive")
+    return user, token
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Info, Warning, register
+from django.db import connections
+
+
+@register("database")
+def database_connection_settings(app_configs, **kwargs):
+    # только то, что настроено неверно; сами настройки — в DB_URL
+    messages = []
+    for alias in connections:
+        conf = connections.settings[alias]
+        if conf.get("OPTIONS", {}).get("pool") and conf["CONN_MAX_AGE"]:
+            messages.append(Warning(f"{alias}: пул несовместим с CONN_MAX_AGE", id="bima.W001"))
+        elif settings.BIMA_ASGI and conf["CONN_MAX_AGE"] != 0:
+            messages.append(Warning(
+                f"{alias}: CONN_MAX_AGE={conf['CONN_MAX_AGE']} под ASGI — соединения не переиспользуются "
+                "между запросами и копятся до закрытия",
+                hint="conn_max_age=0 в DB_URL; для Postgres — пул (pool_max)",
+                id="bima.W003",
+            ))
+    return messages
+
+
+@register("database", deploy=True)
+def database_connection_report(app_configs, **kwargs):
+    # итоговые настройки соединений из DB_URL — в manage.py check --deploy
+    messages = []
+    for alias in connections:
+        conf = connections.settings[alias]
+        options = conf.get("OPTIONS", {})
+        pool = options.get("pool")
+        if pool:
+            mode = "pool min={min_size} max={max_size} timeout={timeout}s".format(**pool)
+        elif conf["CONN_MAX_AGE"] is None:
+            mode = "persistent, без ограничения по времени"
+        elif conf["CONN_MAX_AGE"]:
+            mode = f"persistent, max_age={conf['CONN_MAX_AGE']}s"
+        else:
+            mode = "новое соединение на каждый запрос"
+        details = [mode, f"health_checks={'on' if conf['CONN_HEALTH_CHECKS'] else 'off'}"]
+        if "connect_timeout" in options:
+            details.append(f"connect_timeout={options['connect_timeout']}s")
+        if "options" in options:
+            details.append(options["options"])
+        if "init_command" in options:
+            details.append(options["init_command"])
+        messages.append(Info(f"{alias} ({conf['ENGINE'].rsplit('.', 1)[-1]}): " + "; ".join(details), id="bima.I001"))
+    return messages
+
+
+def _per_process(alias):
+    # LocMem живёт в памяти процесса: другие воркеры его записей не видят
+    return isinstance(caches[alias], LocMemCache)
+
+
+@register()
+def expiry_lock_cache(app_configs, **kwargs):
+    if settings.BIMA_EXPIRY_INTERVAL_SECONDS > 0 and _per_process(settings.BIMA_EXPIRY_LOCK_CACHE):
+        return [Warning(
+            f"BIMA_EXPIRY_LOCK_CACHE={settings.BIMA_EXPIRY_LOCK_CACHE!r} — кеш процесса: "
+            "при нескольких воркерах каждый запустит свою чистку",
+            hint="общий кеш (Redis/Memcached) или BIMA_EXPIRY_INTERVAL_SECONDS только у одного воркера",
+            id="bima.W002",
+        )]
+    return []
+
+
+@register()
+def replica_pin_cache(app_configs, **kwargs):
+    if settings.DB_REPLICA_URLS and _per_process(settings.BIMA_REPLICA_PIN_CACHE):
+        return [Error(
+            f"BIMA_REPLICA_PIN_CACHE={settings.BIMA_REPLICA_PIN_CACHE!r} — кеш процесса: запрос после "
+            "записи на другом воркере прочитает отстающую реплику",
+            hint="алиас CACHES с Redis/Memcached",
+            id="bima.E001",
+        )]
+    return []
+
@@ -1,5 +1,38 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.views import exception_handler
 
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Конфликт с текущим состоянием ресурса."
+    default_code = "conflict"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "Idempotency-Key уже использован с другим телом запроса."
+    default_code = "idempotency_key_reused"
+
+
+class AsgiRequired(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Доступно только при запуске под ASGI."
+    default_code = "asgi_required"
+
+
+class Busy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Сервер перегружен, повторите запрос позже."
+    default_code = "busy"
+    wait = 1  # уходит в Retry-After
+
+
+def flatten_details(raw):
+    # DRF ValidationError -> {field: msg}
+    return {k: (v[0] if isinstance(v, list) else v) for k, v in raw.items()}
+
+
 def exception_handler_json(exc, context):
     resp = exception_handler(exc, context)
     if not resp:
@@ -7,8 +40,7 @@ def exception_handler_json(exc, context):
     raw = resp.data
 
     if isinstance(raw, dict):
-        # DRF ValidationError -> {field: [msg]}
-        details = {k: (v[0] if isinstance(v, list) else v) for k, v in raw.items()}
+        details = flatten_details(raw)
         message = "; ".join([f"{k}: {v}" for k, v in details.items()])
     elif isinstance(raw, list):
         details = {}
@@ -0,0 +1,129 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .models import Summary
+from .replicas import DEFAULT_DB
+
+QUOTE, APPLICATION = Summary.Kind.QUOTE, Summary.Kind.APPLICATION
+# у расчёта меняется только статус; у заявки — статус и updated_at.
+# Цифра после буквы — версия формата: поднять при изменении detail-сериализатора
+ETAGS = {
+    QUOTE: lambda quote: f'"q1-{quote.status}"',
+    APPLICATION: lambda app: f'"a1-{app.updated_at.timestamp():.6f}-{app.status}"',
+}
+# метка «объект только что изменился»: пока она в кеше, ETag туда не кладётся —
+# ответ, прочитанный до коммита изменения, не закешируется как актуальный
+TOMBSTONE = "-"
+TOMBSTONE_TTL = 5
+# сброс из invalidate() доходит только до кеша своего процесса: в LocMem запись
+# живёт пару секунд, чтобы другие воркеры не отвечали 304 на изменённый объект
+LOCAL_TTL = 2
+
+
+def _cache():
+    return caches[settings.BIMA_ETAG_CACHE]
+
+
+def _ttl(cache):
+    return min(settings.BIMA_ETAG_TTL, LOCAL_TTL) if isinstance(cache, LocMemCache) else settings.BIMA_ETAG_TTL
+
+
+def cache_key(kind, user_id, pk):
+    # пользователь в ключе: по чужому id в кеше ничего не найдётся
+    try:
+        pk = uuid.UUID(str(pk))
+    except ValueError:
+        return None
+    return f"etag:{kind}:{user_id}:{pk}"
+
+
+def matches(header, etag):
+    # слабое сравнение, как требует If-None-Match
+    if not header or not etag:
+        return False
+    tags = {tag.removeprefix("W/") for tag in parse_etags(header)}
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+def invalidate(kind, pairs):
+    # pairs — (user_id, pk) изменённых объектов; метки ставятся после коммита
+    keys = {cache_key(kind, user_id, pk): TOMBSTONE for user_id, pk in pairs}
+    if keys:
+        transaction.on_commit(lambda: _cache().set_many(keys, TOMBSTONE_TTL))
+
+
+def cached_response(kind, request, pk):
+    # 304 из кеша без обращения к БД, если клиентский ETag всё ещё актуален
+    header = request.headers.get("If-None-Match")
+    key = cache_key(kind, request.user.pk, pk)
+    if header and key:
+        etag = _cache().get(key)
+        if etag != TOMBSTONE and matches(header, etag):
+            return not_modified(etag)
+    return None
+
+
+async def acached_response(kind, request, pk):
+    header = request.headers.get("If-None-Match")
+    key = cache_key(kind, request.user.pk, pk)
+    if header and key:
+        etag = await _cache().aget(key)
+        if etag != TOMBSTONE and matches(header, etag):
+            return not_modified(etag)
+    return None
+
+
+def _from_primary(instance):
+    # строка с реплики может отставать дольше TOMBSTONE_TTL — её ETag не кешируем
+    return instance._state.db in (None, DEFAULT_DB)
+
+
+def remember(kind, user_id, instance):
+    # только add: строка прочитана до записи в кеш, и set мог бы затереть метку
+    # изменения, поставленную между чтением и записью, устаревшим ETag
+    etag = ETAGS[kind](instance)
+    if _from_primary(instance):
+        cache = _cache()
+        cache.add(cache_key(kind, user_id, instance.pk), etag, _ttl(cache))
+    return etag
+
+
+async def aremember(kind, user_id, instance):
+    etag = ETAGS[kind](instance)
+    if _from_primary(instance):
+        cache = _cache()
+        await cache.aadd(cache_key(kind, user_id, instance.pk), etag, _ttl(cache))
+    return etag
+
+
+class ConditionalRetrieveMixin:
+    # retrieve с ETag: If-None-Match с актуальным ETag из кеша BIMA_ETAG_CACHE —
+    # 304 без запроса к БД и сериализации; иначе обычный ответ с заголовком ETag.
+    # Изменения статуса сбрасывают ETag через invalidate() (комментарий вместо
+    # docstring — он ушёл бы в OpenAPI)
+
+    etag_kind = None
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        response = cached_response(self.etag_kind, request, pk)
+        if response is not None:
+            return response
+        instance = self.get_object()
+        etag = remember(self.etag_kind, request.user.pk, instance)
+        if matches(request.headers.get("If-None-Match"), etag):
+            return not_modified(etag)
+        return Response(self.get_serializer(instance).data, headers={"ETag": etag})
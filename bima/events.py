@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from rest_framework import serializers
+
+from .models import ApplicationEvent
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("id", "user_id", "application_id", "status", "created_at")
+FETCH_LIMIT = 500
+# id, пропущенный в последовательности, ждём столько секунд: на Postgres транзакция
+# с меньшим id может зафиксироваться позже транзакции с большим
+GAP_SECONDS = 10
+MAX_GAP = 1000  # больший разрыв — не незакоммиченные вставки, а чистка/откат пачки
+
+_datetime = serializers.DateTimeField()
+
+
+def as_event(row):
+    event_id, _, application_id, status, created_at = row
+    return {
+        "id": event_id,
+        "application": str(application_id),
+        "status": status,
+        "created_at": _datetime.to_representation(created_at),
+    }
+
+
+def record(rows):
+    # rows — (user_id, application_id, новый статус); вызывать в транзакции,
+    # которая меняет статус: событие фиксируется вместе с ним
+    events = [ApplicationEvent(user_id=user_id, application_id=app_id, status=status) for user_id, app_id, status in rows]
+    if events:
+        ApplicationEvent.objects.bulk_create(events)
+        transaction.on_commit(hub.wake)
+
+
+async def backlog(user_id, after, upto):
+    # события пользователя с id в (after, upto] — догрузка по Last-Event-ID
+    rows = (
+        ApplicationEvent.objects.filter(user_id=user_id, id__gt=after, id__lte=upto)
+        .order_by("id").values_list(*FIELDS)[:FETCH_LIMIT]
+    )
+    return [as_event(row) async for row in rows]
+
+
+class Subscription:
+    __slots__ = ("user_id", "pending", "ready")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.pending = deque()
+        self.ready = asyncio.Event()
+
+    async def wait(self, timeout):
+        # события, пришедшие за timeout секунд; [] — если не было
+        if not self.pending:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.clear()
+        events = list(self.pending)
+        self.pending.clear()
+        return events
+
+
+class EventHub:
+    """Раздача событий ApplicationEvent подпискам одного процесса.
+
+    Одна задача в event loop читает новые события одним запросом раз в
+    BIMA_EVENTS_POLL_SECONDS (или сразу после коммита в этом процессе, см.
+    wake) и раскладывает их по подпискам владельцев. Ожидающая подписка —
+    deque и asyncio.Event, без потока и без запросов к БД; пока подписок нет,
+    задача не работает.
+    """
+
+    def __init__(self):
+        self._reset(None)
+
+    def _reset(self, loop):
+        self._loop = loop
+        self._subscribers = {}  # user_id -> set(Subscription)
+        self._wakeup = asyncio.Event()
+        self._started = asyncio.Event()
+        self._task = None
+        self._gaps = {}  # пропущенный id -> до какого времени его ждать
+        self.last_id = 0
+
+    async def subscribe(self, user_id):
+        # (подписка, последний id на момент подписки): всё после него придёт в подписку
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset(loop)
+        while True:
+            if self._task is None:
+                self._started = asyncio.Event()
+                self._task = loop.create_task(self._run(self._started))
+            task, started = self._task, self._started
+            await started.wait()
+            if self._task is task:
+                break
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()  # не смогли прочитать последний id — БД недоступна
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription, self.last_id
+
+    def unsubscribe(self, subscription):
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[subscription.user_id]
+
+    def wake(self):
+        # из любого потока: после коммита события в этом процессе не ждём интервала
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self, started):
+        try:
+            self.last_id = (await ApplicationEvent.objects.aaggregate(last=Max("id")))["last"] or 0
+            started.set()
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.BIMA_EVENTS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if not self._subscribers:
+                    return
+                try:
+                    await self._poll()
+                except Exception:
+                    logger.exception("events poll failed")
+        finally:
+            if self._task is asyncio.current_task():
+                self._task = None
+            started.set()
+
+    async def _poll(self):
+        now = time.monotonic()
+        self._gaps = {gap: deadline for gap, deadline in self._gaps.items() if deadline > now}
+        query = Q(id__gt=self.last_id)
+        if self._gaps:
+            query |= Q(id__in=list(self._gaps))
+        rows = ApplicationEvent.objects.filter(query).order_by("id").values_list(*FIELDS)[:FETCH_LIMIT]
+        count = 0
+        async for row in rows:
+            count += 1
+            event_id, user_id = row[0], row[1]
+            if event_id > self.last_id:
+                if 1 < event_id - self.last_id <= MAX_GAP:
+                    self._gaps.update((gap, now + GAP_SECONDS) for gap in range(self.last_id + 1, event_id))
+                self.last_id = event_id
+            else:
+                self._gaps.pop(event_id, None)
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions:
+                event = as_event(row)
+                for subscription in subscriptions:
+                    subscription.pending.append(event)
+                    subscription.ready.set()
+        if count == FETCH_LIMIT:
+            self._wakeup.set()  # прочитали не всё — следующий проход сразу
+
+
+hub = EventHub()
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import etags, events, rollup
+from .models import Quote, Application, ApplicationEvent, QUOTE_FACTOR_SOURCES
+from .utils import EXPIRY_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _chunked_update(kind, queryset, chunk_size, status, **values):
+    # короткие транзакции по chunk_size строк, чтобы не держать долгих блокировок;
+    # строки пачки блокируются (FOR UPDATE), поэтому UPDATE меняет ровно их,
+    # ровно они переносятся в сводке (bima/rollup.py) в новый статус и ровно
+    # их ETag сбрасываются (bima/etags.py)
+    fields = rollup.ROW_FIELDS[kind]
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.select_for_update().values_list("pk", *fields)[:chunk_size])
+            if not rows:
+                return total
+            total += queryset.filter(pk__in=[row[0] for row in rows]).update(status=status, **values)
+            rollup.moved(kind, [row[1:] for row in rows], status)
+            etags.invalidate(kind, [(row[1], row[0]) for row in rows])
+            if kind == rollup.APPLICATION:
+                events.record([(row[1], row[0], status) for row in rows])
+
+
+def expire_quotes(now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    now = now or timezone.now()
+    # valid_until < now использует quote_valid_until_idx
+    stale = Quote.objects.filter(valid_until__lt=now, status=Quote.Status.ACTIVE)
+    return _chunked_update(rollup.QUOTE, stale, chunk_size, Quote.Status.EXPIRED)
+
+
+def expire_applications(ttl_days, now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    now = now or timezone.now()
+    stale = Application.objects.filter(
+        status=Application.Status.NEW,
+        created_at__lt=now - timedelta(days=ttl_days),
+    )
+    # update() не трогает auto_now — updated_at (и ETag заявки) двигаем явно
+    return _chunked_update(rollup.APPLICATION, stale, chunk_size, Application.Status.EXPIRED, updated_at=now)
+
+
+def purge_quotes(retention_days, now=None, chunk_size=EXPIRY_CHUNK_SIZE, archive=None):
+    # удаляет USED/EXPIRED расчёты, истёкшие раньше окна хранения;
+    # расчёты с заявкой защищены (on_delete=PROTECT) и остаются.
+    # archive — открытый текстовый файл: перед удалением строки пишутся в него как NDJSON
+    now = now or timezone.now()
+    old = Quote.objects.filter(
+        valid_until__lt=now - timedelta(days=retention_days),
+        status__in=[Quote.Status.USED, Quote.Status.EXPIRED],
+        application__isnull=True,
+    )
+    # база/коэффициенты — из QuoteFactors, чтобы архив хранил расчёт целиком
+    columns = [field.attname for field in Quote._meta.concrete_fields]
+    factors = {name: F(source) for name, source in QUOTE_FACTOR_SOURCES.items()}
+    total = 0
+    while True:
+        with transaction.atomic():
+            # of=self: application__isnull и factors — JOIN, их сторону блокировать незачем
+            rows = list(old.select_for_update(of=("self",)).values(*columns, **factors)[:chunk_size])
+            if not rows:
+                return total
+            if archive is not None:
+                archive.writelines(json.dumps(r, cls=DjangoJSONEncoder) + "\n" for r in rows)
+            deleted, _ = old.filter(pk__in=[r["id"] for r in rows]).delete()
+            rollup.removed(rollup.QUOTE, [(r["user_id"], r["tariff"], r["status"], r["total_amount"]) for r in rows])
+            etags.invalidate(etags.QUOTE, [(r["user_id"], r["id"]) for r in rows])
+            total += deleted
+
+
+def purge_events(retention_days, now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    # лента событий заявок нужна для догрузки после переподключения, не для истории
+    now = now or timezone.now()
+    old = ApplicationEvent.objects.filter(created_at__lt=now - timedelta(days=retention_days))
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(old.values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                return total
+            deleted, _ = ApplicationEvent.objects.filter(pk__in=ids).delete()
+            total += deleted
+
+
+def sweep(chunk_size=EXPIRY_CHUNK_SIZE, retention_days=None, archive=None):
+    now = timezone.now()
+    stats = {}
+    steps = [
+        ("quotes_expired", lambda: expire_quotes(now, chunk_size)),
+        ("events_purged", lambda: purge_events(settings.BIMA_EVENT_RETENTION_DAYS, now, chunk_size)),
+    ]
+    if settings.BIMA_APPLICATION_TTL_DAYS is not None:
+        steps.insert(1, ("applications_expired", lambda: expire_applications(
+            settings.BIMA_APPLICATION_TTL_DAYS, now, chunk_size,
+        )))
+    if retention_days is not None:
+        steps.append(("quotes_purged", lambda: purge_quotes(retention_days, now, chunk_size, archive)))
+    for name, step in steps:
+        started = time.perf_counter()
+        rows = step()
+        stats[name] = (rows, time.perf_counter() - started)
+    return stats
+
+
+LOCK_KEY = "bima:expiry-sweep"
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _run_periodically(interval, retention_days):
+    while True:
+        time.sleep(interval)
+        try:
+            # планировщик есть в каждом воркере; add() с TTL интервала пропускает
+            # одного за интервал, остальные ждут следующего тика
+            if not caches[settings.BIMA_EXPIRY_LOCK_CACHE].add(LOCK_KEY, os.getpid(), interval):
+                continue
+            stats = sweep(retention_days=retention_days)
+            logger.info("expiry sweep: %s", {k: rows for k, (rows, _) in stats.items()})
+        except Exception:
+            logger.exception("expiry sweep failed")
+        finally:
+            close_old_connections()
+
+
+def start_scheduler(interval, retention_days=None):
+    # фоновый поток в процессе воркера; повторный вызов ничего не делает
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_run_periodically, args=(interval, retention_days),
+                name="bima-expiry", daemon=True,
+            )
+            _scheduler.start()
+    return _scheduler
@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import apply_list_filters
+from .models import Quote, Application, QUOTE_FACTOR_SOURCES
+from .serializer import QuoteFilterSerializer, ApplicationFilterSerializer
+
+# (модель, сериализатор фильтров, колонки выгрузки)
+EXPORTS = {
+    "quotes": (
+        Quote, QuoteFilterSerializer,
+        (
+            "id", "user_id", "tariff", "driver_age", "driver_experience", "car_type",
+            "base_amount", "coef_age", "coef_exp", "coef_car", "total_amount",
+            "currency", "ruleset_version", "valid_until", "status", "created_at",
+        ),
+    ),
+    "applications": (
+        Application, ApplicationFilterSerializer,
+        (
+            "id", "user_id", "quote_id", "full_name", "phone", "email", "tariff",
+            "total_amount_snapshot", "status", "meta", "created_at", "updated_at",
+        ),
+    ),
+}
+# колонки выгрузки, которые читаются через связь (заголовок остаётся прежним)
+SOURCES = {
+    "quotes": QUOTE_FACTOR_SOURCES,
+}
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+BATCH_ROWS = 500  # строк в одном куске ответа
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def export_rows(kind, params, chunk_size, using=None):
+    """Колонки и итератор кортежей строк выгрузки kind с фильтрами params.
+
+    Без сортировки и без кеша queryset: iterator(chunk_size) на Postgres
+    читает серверным курсором, в памяти держится один кусок строк.
+    """
+    model, filter_serializer, columns = EXPORTS[kind]
+    queryset = model.objects.using(using).order_by() if using else model.objects.order_by()
+    queryset = apply_list_filters(queryset, params, filter_serializer)
+    sources = SOURCES.get(kind, {})
+    fields = [sources.get(column, column) for column in columns]
+    return columns, queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (str, int)):
+        return value
+    if isinstance(value, (dict, list)):
+        return _encoder.encode(value)
+    return _encoder.default(value)
+
+
+# начало ячейки, с которого Excel/LibreOffice читают формулу; + и - опасны,
+# только если дальше не число или телефон (+992 900 00-00-00 остаётся как есть)
+FORMULA_PREFIXES = ("=", "@", "\t", "\r")
+SIGN_PREFIXES = ("+", "-")
+PLAIN_NUMBER = re.compile(r"[+-]?[\d\s().-]+")
+
+
+def _csv_cell(value):
+    # свободный текст (имя, телефон, email) — с ' перед формульным символом,
+    # чтобы таблица не выполнила его; числа и даты — как есть
+    if isinstance(value, str) and (
+        value.startswith(FORMULA_PREFIXES)
+        or value.startswith(SIGN_PREFIXES) and not PLAIN_NUMBER.fullmatch(value)
+    ):
+        return "'" + value
+    return _cell(value)
+
+
+def render_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    batch = 0
+    for row in rows:
+        writer.writerow([_csv_cell(value) for value in row])
+        batch += 1
+        if batch == BATCH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            batch = 0
+    yield buffer.getvalue()
+
+
+def render_ndjson(columns, rows):
+    lines = []
+    for row in rows:
+        lines.append(_encoder.encode(dict(zip(columns, row))))
+        if len(lines) == BATCH_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+RENDERERS = {"csv": render_csv, "ndjson": render_ndjson}
+
+
+async def aiterate(chunks):
+    # под ASGI Django собрал бы синхронный итератор целиком в память;
+    # вместо этого каждый кусок читается в потоке sync_to_async
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
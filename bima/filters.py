@@ -0,0 +1,42 @@
+from rest_framework.filters import BaseFilterBackend
+
+
+def apply_list_filters(queryset, params, serializer_class):
+    # фильтры списка: status, tariff, created_from/created_to (см. ListFilterSerializer)
+    serializer = serializer_class(data=params)
+    serializer.is_valid(raise_exception=True)
+    return filter_by(queryset, serializer.validated_data)
+
+
+def filter_by(queryset, data):
+    # то же по уже проверенным данным
+    if "status" in data:
+        queryset = queryset.filter(status=data["status"])
+    if "tariff" in data:
+        queryset = queryset.filter(tariff=data["tariff"])
+    if "created_from" in data:
+        queryset = queryset.filter(created_at__gte=data["created_from"])
+    if "created_to" in data:
+        queryset = queryset.filter(created_at__lt=data["created_to"])
+    return queryset
+
+
+class ListFilterBackend(BaseFilterBackend):
+    # фильтры списка описываются сериализатором view.filter_serializer_class
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, "action", None) != "list":
+            return queryset
+        return apply_list_filters(queryset, request.query_params, view.filter_serializer_class)
+
+    def get_schema_operation_parameters(self, view):
+        serializer = view.filter_serializer_class()
+        return [
+            {
+                "name": name,
+                "required": False,
+                "in": "query",
+                "description": field.help_text or "",
+                "schema": {"type": "string"},
+            }
+            for name, field in serializer.fields.items()
+        ]
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from .errors import Busy
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    # тот же pbkdf2_sha256, но число итераций из BIMA_PBKDF2_ITERATIONS;
+    # хеши с другим числом итераций пересчитываются при следующем входе
+    @property
+    def iterations(self):
+        return settings.BIMA_PBKDF2_ITERATIONS or super().iterations
+
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+def _executor():
+    global _pool, _slots
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(settings.BIMA_HASH_WORKERS, thread_name_prefix="bima-hash")
+            _slots = threading.BoundedSemaphore(settings.BIMA_HASH_WORKERS + settings.BIMA_HASH_QUEUE)
+    return _pool, _slots
+
+
+def submit(raw_password):
+    # хеширование в пуле из BIMA_HASH_WORKERS потоков (hashlib отпускает GIL):
+    # всплеск регистраций занимает не больше этого числа ядер. Сверх
+    # BIMA_HASH_QUEUE ожидающих — сразу 503, а не очередь из занятых воркеров
+    pool, slots = _executor()
+    if not slots.acquire(blocking=False):
+        raise Busy()
+    future = pool.submit(hashers.make_password, raw_password)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def hash_password(raw_password):
+    return submit(raw_password).result()
+
+
+async def ahash_password(raw_password):
+    return await asyncio.wrap_future(submit(raw_password))
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .errors import Conflict, IdempotencyKeyReused
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+LOCK_TTL = 30  # секунд; страховка на случай падения воркера посреди запроса
+POLL_INTERVAL = 0.05
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class IdempotentCreateMixin:
+    """Повтор POST с тем же Idempotency-Key отдаёт сохранённый ответ.
+
+    Ответ хранится в кеше BIMA_IDEMPOTENCY_CACHE вместе с отпечатком тела
+    запроса; пока первый запрос выполняется, дубли ждут его результата.
+    Для нескольких воркеров кеш должен быть общим (Redis/Memcached).
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError({HEADER: "не длиннее 255 символов"})
+
+        cache = caches[settings.BIMA_IDEMPOTENCY_CACHE]
+        slot = f"idem:{self.basename}:{request.user.pk}:{_digest(key)}"
+        fingerprint = _digest(json.dumps(request.data, sort_keys=True, default=str))
+
+        stored = cache.get(slot)
+        if stored is None:
+            if cache.add(f"{slot}:lock", 1, LOCK_TTL):
+                # между get и add первый запрос мог сохранить ответ и снять блокировку:
+                # перечитываем, иначе create выполнится второй раз
+                stored = cache.get(slot)
+                if stored is not None:
+                    cache.delete(f"{slot}:lock")
+            else:
+                # такой же запрос уже в работе — ждём его ответ, а не выполняем второй раз
+                stored = self._wait_for(cache, slot)
+                if stored is None:
+                    raise Conflict({HEADER: "запрос с этим ключом ещё выполняется"})
+        if stored is not None:
+            return self._replay(stored, fingerprint)
+
+        try:
+            response = super().create(request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                cache.set(slot, {
+                    "fingerprint": fingerprint,
+                    "status": response.status_code,
+                    "data": response.data,
+                }, settings.BIMA_IDEMPOTENCY_TTL)
+            return response
+        finally:
+            cache.delete(f"{slot}:lock")
+
+    def _wait_for(self, cache, slot):
+        deadline = time.monotonic() + settings.BIMA_IDEMPOTENCY_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            stored = cache.get(slot)
+            if stored is not None:
+                return stored
+            if cache.get(f"{slot}:lock") is None:
+                return None  # первый запрос завершился ошибкой — ответа нет
+        return None
+
+    def _replay(self, stored, fingerprint):
+        if stored["fingerprint"] != fingerprint:
+            raise IdempotencyKeyReused()
+        return Response(stored["data"], status=stored["status"], headers={REPLAY_HEADER: "true"})
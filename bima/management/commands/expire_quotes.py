@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bima.expiry import sweep
+from bima.utils import EXPIRY_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Переводит просроченные расчёты и заявки в EXPIRED; опционально чистит старые расчёты."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=EXPIRY_CHUNK_SIZE)
+        parser.add_argument(
+            "--purge-days", type=int, default=None,
+            help="удалить USED/EXPIRED расчёты без заявки, истёкшие больше N дней назад",
+        )
+        parser.add_argument(
+            "--archive", default=None,
+            help="перед удалением дописать удаляемые строки в файл (NDJSON)",
+        )
+
+    def handle(self, *args, chunk_size, purge_days, archive, **options):
+        if chunk_size <= 0:
+            raise CommandError("--chunk-size должен быть > 0")
+        if archive and purge_days is None:
+            raise CommandError("--archive имеет смысл только вместе с --purge-days")
+
+        if archive:
+            with open(archive, "a", encoding="utf-8") as fh:
+                stats = sweep(chunk_size, purge_days, fh)
+        else:
+            stats = sweep(chunk_size, purge_days)
+
+        for name, (rows, seconds) in stats.items():
+            rate = rows / seconds if seconds else 0
+            self.stdout.write(f"{name}: {rows} строк за {seconds:.2f} с ({rate:.0f} строк/с)")
@@ -0,0 +1,44 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from bima.errors import flatten_details
+from bima.export import EXPORTS, RENDERERS, export_rows
+
+
+class Command(BaseCommand):
+    help = "Выгружает расчёты или заявки в CSV/NDJSON потоком, без загрузки всей таблицы в память."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", dest="fmt", choices=sorted(RENDERERS), default="csv")
+        parser.add_argument("--output", "-o", default="-", help="файл; по умолчанию stdout")
+        parser.add_argument("--from", dest="created_from", help="created_at >= (ISO 8601)")
+        parser.add_argument("--to", dest="created_to", help="created_at < (ISO 8601)")
+        parser.add_argument("--status")
+        parser.add_argument("--tariff")
+        parser.add_argument("--chunk-size", type=int, default=settings.BIMA_EXPORT_CHUNK_SIZE)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, kind, fmt, output, chunk_size, database, **options):
+        if chunk_size <= 0:
+            raise CommandError("--chunk-size должен быть > 0")
+        params = {
+            name: options[name]
+            for name in ("created_from", "created_to", "status", "tariff")
+            if options[name] is not None
+        }
+        try:
+            columns, rows = export_rows(kind, params, chunk_size, using=database)
+        except ValidationError as exc:
+            raise CommandError("; ".join(f"{k}: {v}" for k, v in flatten_details(exc.detail).items()))
+
+        out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8", newline="")
+        try:
+            for chunk in RENDERERS[fmt](columns, rows):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
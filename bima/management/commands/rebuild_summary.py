@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from bima.rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересобирает сводку (таблица Summary) по расчётам и заявкам."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", default=None, metavar="USERNAME", help="только для одного пользователя")
+
+    def handle(self, *args, user, **options):
+        user_id = None
+        if user:
+            try:
+                user_id = get_user_model().objects.get_by_natural_key(user).pk
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"нет пользователя {user}")
+        self.stdout.write(f"строк сводки: {rebuild(user_id)}")
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from bima.models import Quote, Ruleset
+from bima.pricing import engine_for_version
+from bima.replay import replay
+from bima.serializer import build_quote, save_quotes
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает расчёты из JSONL (tariff, driver_age, driver_experience, car_type"
+        "[, total_amount]) выбранной версией правил и показывает расхождения с total_amount. "
+        "Подходит вывод export_bima quotes --format ndjson."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="файл JSONL; - — stdin")
+        parser.add_argument("--ruleset", default=None, help="версия правил; по умолчанию действующая")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--batch-mb", type=float, default=4, help="размер куска файла на задачу воркера, МБ")
+        parser.add_argument("--diff-out", default=None, help="записать расхождения в файл (NDJSON)")
+        parser.add_argument(
+            "--persist", default=None, metavar="USERNAME",
+            help="сохранить пересчитанные расчёты от имени пользователя (статус EXPIRED)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000, help="строк на один bulk_create")
+
+    def handle(self, *args, path, ruleset, workers, batch_mb, diff_out, persist, chunk_size, **options):
+        if workers <= 0 or batch_mb <= 0 or chunk_size <= 0:
+            raise CommandError("--workers, --batch-mb и --chunk-size должны быть > 0")
+        try:
+            engine = engine_for_version(ruleset)
+        except Ruleset.DoesNotExist as e:
+            raise CommandError(str(e))
+
+        on_priced = None
+        saved = [0]
+        if persist:
+            try:
+                user_id = get_user_model().objects.get_by_natural_key(persist).pk
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"нет пользователя {persist}")
+            now = timezone.now()
+
+            def on_priced(rows):
+                # пересчёт истории — не живые предложения: сразу EXPIRED, заявку по ним не создать
+                quotes = []
+                for tariff, age, exp, car_type, calc in rows:
+                    validated = {"tariff": tariff, "driver_age": age, "driver_experience": exp, "car_type": car_type}
+                    quote = build_quote(user_id, validated, engine, calc, valid_until=now)
+                    quote.status = Quote.Status.EXPIRED
+                    quotes.append(quote)
+                save_quotes(quotes, batch_size=chunk_size)
+                saved[0] += len(quotes)
+
+        # воркеры пула — форки этого процесса: открытые соединения с БД им не передаём
+        connections.close_all()
+        # stdin читается в этом процессе; файл воркеры читают сами по смещениям
+        source = sys.stdin.buffer if path == "-" else path
+        if path != "-" and not os.path.isfile(path):
+            raise CommandError(f"нет файла {path}")
+        diffs = open(diff_out, "w", encoding="utf-8") if diff_out else None
+        started = time.perf_counter()
+        try:
+            stats = replay(source, engine, workers, int(batch_mb * (1 << 20)), diffs, on_priced)
+        finally:
+            if diffs:
+                diffs.close()
+        elapsed = time.perf_counter() - started
+
+        rate = stats.lines / elapsed if elapsed else 0
+        self.stdout.write(
+            f"правила {engine.version}: {stats.lines} строк за {elapsed:.2f} с ({rate:.0f} строк/с), "
+            f"некорректных {stats.invalid}"
+        )
+        if stats.compared:
+            delta = stats.new_total - stats.old_total
+            share = delta / stats.old_total * 100 if stats.old_total else 0
+            self.stdout.write(
+                f"сравнено {stats.compared}: изменилось {stats.changed} "
+                f"(дороже {stats.increased}, дешевле {stats.changed - stats.increased}); "
+                f"сумма {stats.old_total} → {stats.new_total} ({delta:+}, {share:+.2f}%)"
+            )
+            for tariff, (count, old, new) in sorted(stats.by_tariff.items()):
+                share = (new - old) / old * 100 if old else 0
+                self.stdout.write(f"  {tariff}: {count} шт., {old} → {new} ({share:+.2f}%)")
+        if persist:
+            self.stdout.write(f"сохранено расчётов: {saved[0]}")
@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+MAX_SQL_PER_REQUEST = 100  # сколько SQL держать для журнала медленных запросов
+
+_current = ContextVar("bima_request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("db_count", "db_time", "serializer_time", "sql", "_depth", "_span_started")
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.sql = []
+        self._depth = 0
+        self._span_started = 0.0
+
+
+def begin_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    # execute_wrapper на всех подключениях; вне запроса (команды, фон) ничего не считает
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.db_count += 1
+        if len(stats.sql) < MAX_SQL_PER_REQUEST:
+            stats.sql.append(sql)
+
+
+def install_query_recorder(connection, **kwargs):
+    # вызывается по сигналу connection_created; список обёрток живёт вместе с
+    # DatabaseWrapper и переживает переподключения, поэтому ставим один раз
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class _SerializerSpan:
+    # учитывается только внешний вызов: вложенные сериализаторы не считаются дважды
+    __slots__ = ("stats",)
+
+    def __enter__(self):
+        self.stats = stats = _current.get()
+        if stats is not None:
+            if stats._depth == 0:
+                stats._span_started = time.perf_counter()
+            stats._depth += 1
+
+    def __exit__(self, *exc):
+        stats = self.stats
+        if stats is not None:
+            stats._depth -= 1
+            if stats._depth == 0:
+                stats.serializer_time += time.perf_counter() - stats._span_started
+
+
+class TimedSerializerMixin:
+    def run_validation(self, *args, **kwargs):
+        with _SerializerSpan():
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, instance):
+        with _SerializerSpan():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labels -> [counts по бакетам..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            prefix = base + "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-2]}')
+            lines.append(f"{self.name}_count{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_DURATION = Histogram(
+    "bima_http_request_duration_seconds", "Время обработки запроса.",
+    LATENCY_BUCKETS, ("view", "method", "status"),
+)
+DB_QUERIES = Histogram(
+    "bima_db_queries_per_request", "Число SQL-запросов на HTTP-запрос.",
+    (0, 1, 2, 3, 5, 10, 20, 50, 100), ("view", "method"),
+)
+DB_DURATION = Histogram(
+    "bima_db_duration_seconds", "Время в БД на HTTP-запрос.",
+    LATENCY_BUCKETS, ("view", "method"),
+)
+SERIALIZER_DURATION = Histogram(
+    "bima_serializer_duration_seconds", "Время в сериализаторах DRF на HTTP-запрос.",
+    LATENCY_BUCKETS, ("view", "method"),
+)
+RESPONSE_SIZE = Histogram(
+    "bima_http_response_size_bytes", "Размер тела ответа.",
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304), ("view", "method"),
+)
+
+REGISTRY = [REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZER_DURATION, RESPONSE_SIZE]
+
+
+def render_prometheus():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,79 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+slow_logger = logging.getLogger("bima.slow")
+
+
+class MetricsMiddleware:
+    """Время запроса, SQL, сериализаторы и размер ответа по каждому view.
+
+    Пишет гистограммы в bima.metrics (отдаются на /api/v1/metrics),
+    добавляет заголовок Server-Timing и логирует медленные запросы с SQL.
+    Работает и в WSGI, и в ASGI без перехода между потоками.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(metrics.install_query_recorder, dispatch_uid="bima-metrics")
+        for connection in connections.all(initialized_only=True):
+            metrics.install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        stats, token = metrics.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        stats, token = metrics.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def finish(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        method = request.method
+
+        metrics.REQUEST_DURATION.observe(elapsed, view, method, str(response.status_code))
+        metrics.DB_QUERIES.observe(stats.db_count, view, method)
+        metrics.DB_DURATION.observe(stats.db_time, view, method)
+        metrics.SERIALIZER_DURATION.observe(stats.serializer_time, view, method)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.observe(len(response.content), view, method)
+
+        response["Server-Timing"] = (
+            f"app;dur={elapsed * 1000:.1f}, "
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_count} queries", '
+            f"ser;dur={stats.serializer_time * 1000:.1f}"
+        )
+
+        if elapsed * 1000 >= settings.BIMA_SLOW_REQUEST_MS:
+            slow_logger.warning(
+                "медленный запрос %s %s → %s за %.0f мс (%s SQL, %.0f мс в БД)\n%s",
+                method, request.get_full_path(), response.status_code, elapsed * 1000,
+                stats.db_count, stats.db_time * 1000, "\n".join(stats.sql),
+            )
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bima', '0002_alter_application_status_alter_quote_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ruleset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=16, unique=True)),
+                ('effective_from', models.DateTimeField(db_index=True)),
+                ('base_prices', models.JSONField(help_text='{"OSAGO": 1000, "KASKO": 5000}')),
+                ('age_ranges', models.JSONField(help_text='[[18, 21, 1.6], [22, 25, 1.3], ...]')),
+                ('exp_ranges', models.JSONField(help_text='[[0, 0, 1.5], [1, 3, 1.2], ...]')),
+                ('car_coef', models.JSONField(help_text='{"sedan": 1.0, "suv": 1.15, ...}')),
+                ('currency', models.CharField(default='TJS', max_length=3)),
+                ('revision', models.PositiveIntegerField(default=0, editable=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('-effective_from',),
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_summary(apps, schema_editor):
+    # сводка по уже существующим данным; дальше её ведёт bima/rollup.py
+    Summary = apps.get_model("bima", "Summary")
+    rows = []
+    for kind, model, amount in (
+        ("quote", "Quote", "total_amount"),
+        ("application", "Application", "total_amount_snapshot"),
+    ):
+        queryset = apps.get_model("bima", model).objects.order_by()
+        for row in queryset.values("user_id", "tariff", "status").annotate(count=Count("pk"), amount=Sum(amount)):
+            rows.append(Summary(kind=kind, **row))
+    Summary.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bima', '0004_requestprofile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Summary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('quote', 'Quote'), ('application', 'Application')], max_length=12)),
+                ('tariff', models.CharField(choices=[('OSAGO', 'OSAGO'), ('KASKO', 'KASKO')], max_length=20)),
+                ('status', models.CharField(max_length=12)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'tariff', 'status'), name='summary_user_key')],
+            },
+        ),
+        migrations.RunPython(fill_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    # до индекса регистрация проверяла email SELECT-ом, но гонка могла пропустить дубль
+    User = apps.get_model("auth", "User")
+    duplicates = list(
+        User.objects.exclude(email="").values("email").annotate(n=Count("pk")).filter(n__gt=1)
+        .values_list("email", flat=True)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(f"email у нескольких пользователей, исправьте перед миграцией: {', '.join(duplicates)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("bima", "0006_applicationevent"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        # частичный: пустой email (необязательное поле) может быть у многих
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_uniq ON auth_user (email) WHERE email <> ''",
+            "DROP INDEX auth_user_email_uniq",
+        ),
+    ]
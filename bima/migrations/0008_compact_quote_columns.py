@@ -0,0 +1,65 @@
+import bima.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._compact_quote import CAR_TYPE_CODES, QUOTE_STATUS_CODES, TARIFF_CODES
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bima", "0007_auth_user_email_uniq"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuoteFactors",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("ruleset_version", models.CharField(max_length=16)),
+                ("currency", models.CharField(max_length=3)),
+                ("base_amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("coef_age", models.DecimalField(decimal_places=3, max_digits=6)),
+                ("coef_exp", models.DecimalField(decimal_places=3, max_digits=6)),
+                ("coef_car", models.DecimalField(decimal_places=3, max_digits=6)),
+            ],
+            options={
+                "verbose_name_plural": "quote factors",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=["base_amount", "coef_age", "coef_exp", "coef_car", "currency", "ruleset_version"],
+                        name="quote_factors_key",
+                    )
+                ],
+            },
+        ),
+        # шаг 1 из 3: новые колонки рядом со старыми, пока пустые
+        migrations.AddField(
+            model_name="quote",
+            name="factors",
+            field=models.ForeignKey(
+                db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT,
+                related_name="+", to="bima.quotefactors",
+            ),
+        ),
+        migrations.AddField(
+            model_name="quote",
+            name="tariff_code",
+            field=bima.models.CodeField(codes=TARIFF_CODES, null=True),
+        ),
+        migrations.AddField(
+            model_name="quote",
+            name="car_type_code",
+            field=bima.models.CodeField(codes=CAR_TYPE_CODES, null=True),
+        ),
+        migrations.AddField(
+            model_name="quote",
+            name="status_code",
+            field=bima.models.CodeField(codes=QUOTE_STATUS_CODES, null=True),
+        ),
+        migrations.AddField(
+            model_name="quote",
+            name="total_minor",
+            field=bima.models.MinorUnitsField(decimal_places=2, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from ._compact_quote import fill_compact
+
+
+def backfill(apps, schema_editor):
+    fill_compact(schema_editor)
+
+
+class Migration(migrations.Migration):
+    # шаг 2 из 3: перенос пачками, у каждой своя транзакция. Старые колонки ещё на
+    # месте, поэтому обратный шаг ничего не делает: новые колонки удалит откат 0008
+    atomic = False
+
+    dependencies = [
+        ("bima", "0008_compact_quote_columns"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
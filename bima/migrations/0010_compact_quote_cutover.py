@@ -0,0 +1,88 @@
+import bima.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._compact_quote import CAR_TYPE_CODES, QUOTE_STATUS_CODES, TARIFF_CODES, fill_compact, restore_wide
+
+# старые колонки перед удалением — nullable: при откате они возвращаются пустыми
+# и заполняются restore_wide пачками, а NOT NULL ставится в самом конце
+WIDE = {
+    "tariff": models.CharField(max_length=20, choices=[("OSAGO", "OSAGO"), ("KASKO", "KASKO")], null=True),
+    "car_type": models.CharField(
+        max_length=20, choices=[("sedan", "Sedan"), ("suv", "SUV"), ("truck", "Truck"), ("sport", "Sport")],
+        null=True,
+    ),
+    "status": models.CharField(
+        max_length=10, choices=[("ACTIVE", "Active"), ("USED", "Used"), ("EXPIRED", "Expired")],
+        default="ACTIVE", db_index=True, null=True,
+    ),
+    "total_amount": models.DecimalField(decimal_places=2, max_digits=12, null=True),
+    "base_amount": models.DecimalField(decimal_places=2, max_digits=12, null=True),
+    "coef_age": models.DecimalField(decimal_places=3, max_digits=6, null=True),
+    "coef_exp": models.DecimalField(decimal_places=3, max_digits=6, null=True),
+    "coef_car": models.DecimalField(decimal_places=3, max_digits=6, null=True),
+    "currency": models.CharField(max_length=3, default="TJS", null=True),
+    "ruleset_version": models.CharField(max_length=16, default="v1", null=True),
+}
+RENAMES = {"tariff_code": "tariff", "car_type_code": "car_type", "status_code": "status", "total_minor": "total_amount"}
+
+
+def cutover(apps, schema_editor):
+    # строки, записанные после 0009, и сменившиеся с тех пор статусы
+    fill_compact(schema_editor)
+
+
+def rollback(apps, schema_editor):
+    restore_wide(schema_editor)
+
+
+class Migration(migrations.Migration):
+    # шаг 3 из 3: старые колонки удаляются, новые получают их имена. На время
+    # миграции запись в bima_quote стоит остановить: строку, вставленную между
+    # cutover и NOT NULL, миграция не перенесёт и упадёт
+    atomic = False
+
+    dependencies = [
+        ("bima", "0009_compact_quote_backfill"),
+    ]
+
+    operations = [
+        *(migrations.AlterField(model_name="quote", name=name, field=field) for name, field in WIDE.items()),
+        migrations.RunPython(cutover, rollback),
+        *(migrations.RemoveField(model_name="quote", name=name) for name in WIDE),
+        *(migrations.RenameField(model_name="quote", old_name=old, new_name=new) for old, new in RENAMES.items()),
+        migrations.AlterField(
+            model_name="quote",
+            name="factors",
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.PROTECT,
+                related_name="+", to="bima.quotefactors",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="quote",
+            name="tariff",
+            field=bima.models.CodeField(choices=[("OSAGO", "OSAGO"), ("KASKO", "KASKO")], codes=TARIFF_CODES),
+        ),
+        migrations.AlterField(
+            model_name="quote",
+            name="car_type",
+            field=bima.models.CodeField(
+                choices=[("sedan", "Sedan"), ("suv", "SUV"), ("truck", "Truck"), ("sport", "Sport")],
+                codes=CAR_TYPE_CODES,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="quote",
+            name="status",
+            field=bima.models.CodeField(
+                choices=[("ACTIVE", "Active"), ("USED", "Used"), ("EXPIRED", "Expired")],
+                codes=QUOTE_STATUS_CODES, db_index=True, default="ACTIVE",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="quote",
+            name="total_amount",
+            field=bima.models.MinorUnitsField(decimal_places=2, max_digits=12),
+        ),
+    ]
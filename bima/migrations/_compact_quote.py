@@ -0,0 +1,90 @@
+# SQL миграций 0009/0010 (компактная таблица расчётов). Модуль с "_" загрузчик
+# миграций пропускает; коды — на момент миграции, как в bima.models
+from django.db import transaction
+
+TARIFF_CODES = {"OSAGO": 1, "KASKO": 2}
+CAR_TYPE_CODES = {"sedan": 1, "suv": 2, "truck": 3, "sport": 4}
+QUOTE_STATUS_CODES = {"ACTIVE": 1, "USED": 2, "EXPIRED": 3}
+FACTOR_COLUMNS = ("ruleset_version", "currency", "base_amount", "coef_age", "coef_exp", "coef_car")
+# (старая колонка, новая колонка, коды) для перечислений
+CODE_COLUMNS = (
+    ("tariff", "tariff_code", TARIFF_CODES),
+    ("car_type", "car_type_code", CAR_TYPE_CODES),
+    ("status", "status_code", QUOTE_STATUS_CODES),
+)
+CHUNK_SIZE = 10_000
+
+
+def _chunks(schema_editor, chunk_size):
+    # пачки по первичному ключу (id > last AND id <= upper): каждая — своя короткая
+    # транзакция, а не один UPDATE на всю таблицу
+    q = schema_editor.quote_name
+    quote, pk = q("bima_quote"), f'{q("bima_quote")}.{q("id")}'
+    last = None
+    while True:
+        after, params = (f"WHERE {pk} > %s", [last]) if last is not None else ("", [])
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"SELECT {pk} FROM {quote} {after} ORDER BY {pk} LIMIT 1 OFFSET %s", [*params, chunk_size - 1])
+            row = cursor.fetchone()
+        if row is None:
+            yield f"{pk} > %s" if last is not None else "1 = 1", params
+            return
+        yield (f"{pk} > %s AND {pk} <= %s", [last, row[0]]) if last is not None else (f"{pk} <= %s", [row[0]])
+        last = row[0]
+
+
+def _case(column, mapping):
+    whens = " ".join(f"WHEN {value!r} THEN {code!r}" for value, code in mapping.items())
+    return f"CASE {column} {whens} END"
+
+
+def fill_compact(schema_editor, chunk_size=CHUNK_SIZE):
+    """Новые колонки из старых; повторный проход дописывает строки без factors_id
+    и догоняет status, сменившийся после прошлого прохода."""
+    q = schema_editor.quote_name
+    quote, factors = q("bima_quote"), q("bima_quotefactors")
+    columns = ", ".join(q(c) for c in FACTOR_COLUMNS)
+    match = " AND ".join(f"f.{q(c)} = {quote}.{q(c)}" for c in FACTOR_COLUMNS)
+    codes = ", ".join(f"{q(new)} = {_case(f'{quote}.{q(old)}', values)}" for old, new, values in CODE_COLUMNS)
+    status = _case(f"{quote}.{q('status')}", QUOTE_STATUS_CODES)
+    for where, params in _chunks(schema_editor, chunk_size):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                f"INSERT INTO {factors} ({columns}) SELECT DISTINCT {columns} FROM {quote} "
+                f"WHERE {where} AND {q('factors_id')} IS NULL "
+                f"AND NOT EXISTS (SELECT 1 FROM {factors} f WHERE {match})",
+                params,
+            )
+            schema_editor.execute(
+                f"UPDATE {quote} SET "
+                f"{q('factors_id')} = (SELECT f.{q('id')} FROM {factors} f WHERE {match}), {codes}, "
+                f"{q('total_minor')} = CAST(ROUND({q('total_amount')} * 100) AS BIGINT) "
+                f"WHERE {where} AND {q('factors_id')} IS NULL",
+                params,
+            )
+            schema_editor.execute(
+                f"UPDATE {quote} SET {q('status_code')} = {status} "
+                f"WHERE {where} AND {q('status_code')} <> {status}",
+                params,
+            )
+
+
+def restore_wide(schema_editor, chunk_size=CHUNK_SIZE):
+    """Обратно: старые колонки из кодов, сотых и QuoteFactors."""
+    q = schema_editor.quote_name
+    quote, factors = q("bima_quote"), q("bima_quotefactors")
+    codes = ", ".join(
+        f"{q(old)} = {_case(f'{quote}.{q(new)}', {code: value for value, code in values.items()})}"
+        for old, new, values in CODE_COLUMNS
+    )
+    rules = ", ".join(
+        f"{q(c)} = (SELECT f.{q(c)} FROM {factors} f WHERE f.{q('id')} = {quote}.{q('factors_id')})"
+        for c in FACTOR_COLUMNS
+    )
+    for where, params in _chunks(schema_editor, chunk_size):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                f"UPDATE {quote} SET {codes}, {rules}, {q('total_amount')} = {q('total_minor')} / 100.0 "
+                f"WHERE {where}",
+                params,
+            )
@@ -1,6 +1,12 @@
 import uuid
+from decimal import Decimal, ROUND_HALF_UP
+from functools import partial
+
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 class Tariff(models.TextChoices):
@@ -15,6 +21,233 @@ class CarType(models.TextChoices):
     SPORT = "sport", "Sport"
 
 
+class RulesetQuerySet(models.QuerySet):
+    def effective(self, now=None):
+        now = now or timezone.now()
+        return self.filter(effective_from__lte=now).order_by("-effective_from", "-pk")
+
+
+class Ruleset(models.Model):
+    # тарифные правила; формат полей — как у констант в bima/utils.py
+    version = models.CharField(max_length=16, unique=True)
+    effective_from = models.DateTimeField(db_index=True)
+    base_prices = models.JSONField(help_text='{"OSAGO": 1000, "KASKO": 5000}')
+    age_ranges = models.JSONField(help_text="[[18, 21, 1.6], [22, 25, 1.3], ...]")
+    exp_ranges = models.JSONField(help_text="[[0, 0, 1.5], [1, 3, 1.2], ...]")
+    car_coef = models.JSONField(help_text='{"sedan": 1.0, "suv": 1.15, ...}')
+    currency = models.CharField(max_length=3, default="TJS")
+    # счётчик изменений: воркеры сравнивают его, чтобы понять, что пора перекомпилировать
+    revision = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RulesetQuerySet.as_manager()
+
+    # после сохранения версии не меняются: по version расчёты и replay находят,
+    # чем посчитана цена; новые коэффициенты — новая версия
+    RULE_FIELDS = ("version", "base_prices", "age_ranges", "exp_ranges", "car_coef", "currency")
+
+    class Meta:
+        ordering = ("-effective_from",)
+
+    def __str__(self):
+        return f"{self.version} c {self.effective_from:%Y-%m-%d %H:%M}"
+
+    def compile(self):
+        from .pricing import PricingEngine
+
+        return PricingEngine(
+            self.version,
+            self.base_prices,
+            [tuple(r) for r in self.age_ranges],
+            [tuple(r) for r in self.exp_ranges],
+            self.car_coef,
+            currency=self.currency,
+        )
+
+    def clean(self):
+        if self.pk is not None:
+            stored = Ruleset.objects.filter(pk=self.pk).values(*self.RULE_FIELDS).first() or {}
+            changed = [name for name, value in stored.items() if getattr(self, name) != value]
+            if changed:
+                raise ValidationError({
+                    name: "правила сохранённой версии не меняются — заведите новую версию" for name in changed
+                })
+        try:
+            self.compile()
+        except (TypeError, ValueError, ArithmeticError) as e:
+            raise ValidationError(f"некорректные правила: {e}")
+        missing = set(Tariff.values) - set(self.base_prices or {})
+        if missing:
+            raise ValidationError({"base_prices": f"нет цен для {', '.join(sorted(missing))}"})
+        missing = set(CarType.values) - set(self.car_coef or {})
+        if missing:
+            raise ValidationError({"car_coef": f"нет коэффициентов для {', '.join(sorted(missing))}"})
+
+    def save(self, *args, **kwargs):
+        self.revision += 1
+        super().save(*args, **kwargs)
+
+
+class CodeField(models.PositiveSmallIntegerField):
+    """Строковое значение из choices, в БД — smallint-код из codes.
+
+    В Python (фильтры, values(), сериализаторы) значение остаётся строкой.
+    codes — постоянное соответствие «значение → код»: коды не меняются и не
+    переиспользуются, новое значение choices получает новый код.
+    """
+
+    def __init__(self, *args, codes=None, **kwargs):
+        self.codes = dict(codes or {})
+        self.values_by_code = {code: value for value, code in self.codes.items()}
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["codes"] = self.codes
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # без проверки диапазона smallint: в Python значение — строка
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.values_by_code[value]
+
+    def to_python(self, value):
+        if value is None or value in self.codes:
+            return value
+        if value in self.values_by_code:
+            return self.values_by_code[value]
+        raise ValidationError(f"Неизвестное значение {value!r}.", code="invalid_choice")
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        try:
+            return self.codes[value]
+        except KeyError:
+            raise ValueError(f"Поле {self.name!r}: неизвестное значение {value!r}.") from None
+
+
+class MinorUnitsField(models.DecimalField):
+    """Decimal в Python, в БД — bigint в минимальных единицах (сотых)."""
+
+    def get_internal_type(self):
+        return "BigIntegerField"
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Decimal(value).scaleb(-self.decimal_places)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None or hasattr(value, "as_sql"):
+            return value
+        return int(value.scaleb(self.decimal_places).to_integral_value(ROUND_HALF_UP))
+
+
+# коды перечислений в таблице расчётов; только дописывать
+TARIFF_CODES = {"OSAGO": 1, "KASKO": 2}
+CAR_TYPE_CODES = {"sedan": 1, "suv": 2, "truck": 3, "sport": 4}
+QUOTE_STATUS_CODES = {"ACTIVE": 1, "USED": 2, "EXPIRED": 3}
+# что в расчёте задают правила, а не ввод: хранится в QuoteFactors, а не в каждой строке
+FACTOR_FIELDS = ("base_amount", "coef_age", "coef_exp", "coef_car", "currency", "ruleset_version")
+FACTOR_DEFAULTS = {"currency": "TJS", "ruleset_version": "v1"}  # как были default у колонок Quote
+
+_factors_by_id = {}
+_factors_by_key = {}
+
+
+def _remember(key, factors):
+    _factors_by_key[key] = _factors_by_id[factors.pk] = factors
+
+
+class QuoteFactorsManager(models.Manager):
+    # строки QuoteFactors не меняются и не удаляются, поэтому кешируются в
+    # процессе без TTL; на версию правил их единицы-сотни
+
+    def cached(self, pk):
+        factors = _factors_by_id.get(pk)
+        if factors is None:
+            factors = _factors_by_id[pk] = self.get(pk=pk)
+        return factors
+
+    def attach(self, quotes):
+        # factors_id несохранённым расчётам по их FACTOR_FIELDS; новая строка
+        # попадает в кеш только после коммита — откат не оставит в нём висячий id
+        created = {}
+        for quote in quotes:
+            values = quote.__dict__.get("_factor_values")
+            if values is None:
+                continue
+            key = tuple(values[name] for name in FACTOR_FIELDS)
+            factors = _factors_by_key.get(key) or created.get(key)
+            if factors is None:
+                factors, _ = self.get_or_create(**dict(zip(FACTOR_FIELDS, key)))
+                created[key] = factors
+                transaction.on_commit(partial(_remember, key, factors))
+            quote.factors_id = factors.pk
+
+
+class QuoteFactors(models.Model):
+    # база и коэффициенты, общие для всех расчётов с той же версией правил и теми же
+    # диапазонами возраста/стажа/типом машины; строка не меняется после создания.
+    # Хранятся, а не выводятся из Ruleset при чтении: иначе каждое чтение компилировало
+    # бы версию правил расчёта (в том числе давно не действующую и встроенную v1), а
+    # строку Ruleset можно удалить — значения, по которым посчитана цена, остаются здесь
+    id = models.AutoField(primary_key=True)  # int4: ссылка из каждой строки Quote
+    ruleset_version = models.CharField(max_length=16)
+    currency = models.CharField(max_length=3)
+    base_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    coef_age = models.DecimalField(max_digits=6, decimal_places=3)
+    coef_exp = models.DecimalField(max_digits=6, decimal_places=3)
+    coef_car = models.DecimalField(max_digits=6, decimal_places=3)
+
+    objects = QuoteFactorsManager()
+
+    class Meta:
+        verbose_name_plural = "quote factors"
+        constraints = [
+            models.UniqueConstraint(fields=list(FACTOR_FIELDS), name="quote_factors_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.ruleset_version}: {self.base_amount} × {self.coef_age} × {self.coef_exp} × {self.coef_car}"
+
+
+class QuoteQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create (и abulk_create через него) не вызывает save(): factors_id — здесь
+        objs = list(objs)
+        QuoteFactors.objects.attach(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+def _factor(name):
+    # поле QuoteFactors как атрибут Quote: Quote(base_amount=...) и quote.coef_age
+    # работают как с обычными колонками; несохранённый расчёт держит значения у себя
+    def get(self):
+        values = self.__dict__.get("_factor_values")
+        if values is not None:
+            return values.get(name)
+        if self.factors_id is None:
+            return FACTOR_DEFAULTS.get(name)
+        return getattr(self.factors_row, name)
+
+    def set(self, value):
+        values = self.__dict__.get("_factor_values")
+        if values is None:
+            values = self.__dict__["_factor_values"] = (
+                {field: getattr(self.factors_row, field) for field in FACTOR_FIELDS} if self.factors_id
+                else dict(FACTOR_DEFAULTS)
+            )
+        values[name] = value
+
+    return property(get, set)
+
+
 class Quote(models.Model):
     class Status(models.TextChoices):
         ACTIVE = "ACTIVE"
@@ -28,28 +261,34 @@ class Quote(models.Model):
         related_name="quotes",
     )
 
-    tariff = models.CharField(max_length=20, choices=Tariff.choices)
+    # компактная строка: перечисления — smallint-коды, сумма — целые сотые,
+    # база/коэффициенты/валюта/версия правил — ссылкой на QuoteFactors
+    tariff = CodeField(choices=Tariff.choices, codes=TARIFF_CODES)
     driver_age = models.PositiveSmallIntegerField()
     driver_experience = models.PositiveSmallIntegerField()
-    car_type = models.CharField(max_length=20, choices=CarType.choices)
+    car_type = CodeField(choices=CarType.choices, codes=CAR_TYPE_CODES)
 
-    base_amount = models.DecimalField(max_digits=12, decimal_places=2)
-    coef_age = models.DecimalField(max_digits=6, decimal_places=3)
-    coef_exp = models.DecimalField(max_digits=6, decimal_places=3)
-    coef_car = models.DecimalField(max_digits=6, decimal_places=3)
-    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
-    currency = models.CharField(max_length=3, default="TJS")
-    ruleset_version = models.CharField(max_length=16, default="v1")
+    factors = models.ForeignKey(QuoteFactors, on_delete=models.PROTECT, related_name="+", db_index=False)
+    total_amount = MinorUnitsField(max_digits=12, decimal_places=2)
+
+    base_amount = _factor("base_amount")
+    coef_age = _factor("coef_age")
+    coef_exp = _factor("coef_exp")
+    coef_car = _factor("coef_car")
+    currency = _factor("currency")
+    ruleset_version = _factor("ruleset_version")
 
     valid_until = models.DateTimeField()
-    status = models.CharField(
-        max_length=10,
+    status = CodeField(
         choices=Status.choices,
+        codes=QUOTE_STATUS_CODES,
         default=Status.ACTIVE,
         db_index=True,  # индекс для фильтрации по статусу
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = QuoteQuerySet.as_manager()
+
     class Meta:
         indexes = [
             # индекс для выборки котировок пользователя и сортировки по дате
@@ -61,6 +300,21 @@ class Quote(models.Model):
     def __str__(self):
         return f"{self.id} {self.tariff} {self.total_amount} {self.currency}"
 
+    @property
+    def factors_row(self):
+        # select_related("factors") или кеш процесса — без запроса на каждый расчёт
+        if Quote.factors.is_cached(self):
+            return self.factors
+        return QuoteFactors.objects.cached(self.factors_id)
+
+    def save(self, *args, **kwargs):
+        QuoteFactors.objects.attach([self])
+        super().save(*args, **kwargs)
+
+
+# ORM-пути полей правил для values()/values_list(): они в QuoteFactors, а не в Quote
+QUOTE_FACTOR_SOURCES = {name: f"factors__{name}" for name in FACTOR_FIELDS}
+
 
 class Application(models.Model):
     class Status(models.TextChoices):
@@ -107,3 +361,77 @@ class Application(models.Model):
 
     def __str__(self):
         return f"{self.id} {self.tariff} {self.total_amount_snapshot} {self.status}"
+
+
+class ApplicationEvent(models.Model):
+    # смена статуса заявки для ленты /api/v1/applications/events (bima/events.py);
+    # id — курсор ленты (Last-Event-ID), старые события удаляет expire_quotes
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name="events")
+    status = models.CharField(max_length=12, choices=Application.Status.choices)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # догрузка пропущенного по Last-Event-ID: события пользователя после курсора
+            models.Index(fields=["user", "id"], name="app_event_user_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} {self.application_id} {self.status}"
+
+
+class Summary(models.Model):
+    # счётчики для GET /api/v1/summary/: строка на (пользователь, сущность, тариф, статус).
+    # Меняются инкрементально в тех же транзакциях, что и расчёты/заявки (bima/rollup.py),
+    # пересобираются командой rebuild_summary
+    class Kind(models.TextChoices):
+        QUOTE = "quote"
+        APPLICATION = "application"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    kind = models.CharField(max_length=12, choices=Kind.choices)
+    tariff = models.CharField(max_length=20, choices=Tariff.choices)
+    status = models.CharField(max_length=12)
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)  # сумма премий
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "kind", "tariff", "status"], name="summary_user_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.kind} {self.tariff} {self.status}: {self.count}"
+
+
+class RequestProfile(models.Model):
+    # результат профилирования одного запроса (bima.profiling.ProfilerMiddleware)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="+",
+    )
+    method = models.CharField(max_length=8)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    report = models.TextField()  # pstats, сортировка по cumulative
+    raw = models.BinaryField()  # marshal-дамп для snakeviz/gprof2dot
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.method} {self.path} {self.duration_ms:.0f} мс"
@@ -0,0 +1,121 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по (created_at, id) без OFFSET и COUNT(*).
+
+    Курсор — непрозрачная строка с позицией последней строки страницы,
+    следующая страница берётся условием «строго после неё» по индексу
+    (user, -created_at), поэтому страница N стоит столько же, сколько первая.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    invalid_cursor_message = "Некорректный курсор."
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, created_at, pk):
+        raw = json.dumps([created_at.isoformat(), str(pk)]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+            created_at, pk = json.loads(raw)
+            return datetime.fromisoformat(created_at), pk
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        window, page_size = self.window(queryset, request)
+        return self.page(list(window), page_size)
+
+    def window(self, queryset, request):
+        # ленивый срез следующей страницы; async view вычисляет его сам (async for)
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by("-created_at", "-id")
+        if position is not None:
+            created_at, pk = position
+            try:
+                pk = queryset.model._meta.pk.to_python(pk)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        # одна лишняя строка говорит, есть ли следующая страница — без COUNT(*)
+        return queryset[:page_size + 1], page_size
+
+    def page(self, rows, page_size):
+        page = rows[:page_size]
+        self.next_cursor = None
+        if len(rows) > page_size:
+            last = page[-1]
+            if isinstance(last, dict):  # строки из values(), см. RowListSerializer
+                self.next_cursor = self.encode_cursor(last["created_at"], last["id"])
+            else:
+                self.next_cursor = self.encode_cursor(last.created_at, last.pk)
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        return {"next": self.get_next_link(), "results": data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Курсор следующей страницы (из поля next).",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": f"Размер страницы (до {self.max_page_size}).",
+                "schema": {"type": "integer"},
+            },
+        ]
@@ -1,6 +1,17 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from rest_framework.permissions import BasePermission
 
 class IsOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
         user_id = getattr(obj, "user_id", None)
         return bool(request.user and request.user.is_authenticated and user_id == request.user.id)
+
+
+class IsStaffOrMetricsToken(BasePermission):
+    # Prometheus ходит с заголовком X-Metrics-Token, люди — со staff JWT
+    def has_permission(self, request, view):
+        token = settings.BIMA_METRICS_TOKEN
+        if token and constant_time_compare(request.headers.get("X-Metrics-Token", ""), token):
+            return True
+        return bool(request.user and request.user.is_staff)
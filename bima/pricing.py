@@ -0,0 +1,163 @@
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from .utils import (
+    RULESET_VERSION, BASE_PRICES, AGE_RANGES, EXP_RANGES, CAR_COEF, CURRENCY,
+    AGE_MIN, AGE_MAX, EXP_MIN, EXP_MAX, pick_from_ranges, Calculated,
+)
+
+CENT = Decimal("0.01")
+COEF = Decimal("0.001")  # точность коэффициентов в Quote.coef_*
+
+
+def _dec(value) -> Decimal:
+    # через str, чтобы 1.15 не превратилось в 1.149999...
+    return Decimal(str(value))
+
+
+def _compile_ranges(ranges, lo: int, hi: int):
+    # плотная таблица: индекс = значение - lo, элемент — номер класса коэффициента;
+    # различных коэффициентов единицы, поэтому итоговые цены можно посчитать заранее
+    coefs = [_dec(pick_from_ranges(value, ranges)).quantize(COEF) for value in range(lo, hi + 1)]
+    classes = tuple(dict.fromkeys(coefs))
+    index = {coef: i for i, coef in enumerate(classes)}
+    return tuple(index[coef] for coef in coefs), classes
+
+
+class PricingEngine:
+    """Набор тарифных правил, скомпилированный в таблицы поиска.
+
+    Возраст и стаж раскладываются в плотные массивы классов коэффициентов,
+    а результат для каждой комбинации (тариф, авто, класс возраста, класс
+    стажа) считается один раз при компиляции. Расчёт цены — несколько
+    обращений по индексу без циклов и арифметики. Экземпляр неизменяем,
+    его и возвращаемые Calculated можно разделять между потоками.
+    """
+
+    __slots__ = ("version", "currency", "rules", "_age", "_exp", "_table")
+
+    def __init__(self, version, base_prices, age_ranges, exp_ranges, car_coef, currency=CURRENCY):
+        self.version = version
+        self.currency = currency
+        # исходные правила — чтобы пересобрать движок в другом процессе
+        self.rules = {
+            "version": version,
+            "base_prices": dict(base_prices),
+            "age_ranges": [tuple(r) for r in age_ranges],
+            "exp_ranges": [tuple(r) for r in exp_ranges],
+            "car_coef": dict(car_coef),
+            "currency": currency,
+        }
+        self._age, age_classes = _compile_ranges(age_ranges, AGE_MIN, AGE_MAX)
+        self._exp, exp_classes = _compile_ranges(exp_ranges, EXP_MIN, EXP_MAX)
+        self._table = {}
+        for tariff, base in base_prices.items():
+            base = _dec(base).quantize(CENT)
+            for car_type, c_car in car_coef.items():
+                c_car = _dec(c_car).quantize(COEF)
+                self._table[tariff, car_type] = tuple(
+                    tuple(
+                        Calculated(
+                            base=base, c_age=c_age, c_exp=c_exp, c_car=c_car,
+                            total=(base * c_age * c_exp * c_car).quantize(CENT, rounding=ROUND_HALF_UP),
+                        )
+                        for c_exp in exp_classes
+                    )
+                    for c_age in age_classes
+                )
+
+    def price(self, tariff: str, age: int, exp: int, car_type: str) -> Calculated:
+        if not (AGE_MIN <= age <= AGE_MAX and EXP_MIN <= exp <= EXP_MAX):
+            raise ValueError(f"вне диапазона: age={age}, exp={exp}")
+        try:
+            by_age = self._table[tariff, car_type]
+        except KeyError:
+            raise ValueError(f"нет в тарифных правилах: {tariff}/{car_type}") from None
+        return by_age[self._age[age - AGE_MIN]][self._exp[exp - EXP_MIN]]
+
+    def price_many(self, rows) -> list[Calculated]:
+        # rows: итерируемое (tariff, age, exp, car_type); один проход без обращений к БД
+        price = self.price
+        return [price(*row) for row in rows]
+
+
+# правила из bima/utils.py — пока в таблице Ruleset нет действующей версии
+DEFAULT_ENGINE = PricingEngine(RULESET_VERSION, BASE_PRICES, AGE_RANGES, EXP_RANGES, CAR_COEF)
+
+_engine = DEFAULT_ENGINE
+_engine_key = None  # (pk, revision) загруженного Ruleset; None — правила по умолчанию
+_next_check = 0.0
+_lock = threading.Lock()
+_listeners = []
+
+
+def on_engine_change(callback):
+    # callback() вызывается после подмены движка (например, сброс кешей)
+    _listeners.append(callback)
+    return callback
+
+
+def set_engine(engine: PricingEngine, key=None):
+    global _engine, _engine_key
+    # присваивание атомарно: запросы видят либо старый, либо новый движок целиком
+    _engine, _engine_key = engine, key
+    for callback in _listeners:
+        callback()
+
+
+def _reload():
+    from .models import Ruleset
+
+    row = Ruleset.objects.effective().values("pk", "revision").first()
+    key = (row["pk"], row["revision"]) if row else None
+    if key == _engine_key:
+        return
+    engine = Ruleset.objects.get(pk=row["pk"]).compile() if row else DEFAULT_ENGINE
+    set_engine(engine, key)
+
+
+def get_engine() -> PricingEngine:
+    global _next_check
+    now = time.monotonic()
+    # проверка версии в БД — не чаще раза в BIMA_RULESET_RELOAD_SECONDS;
+    # если другой поток уже проверяет, работаем на текущем движке
+    if now >= _next_check and _lock.acquire(blocking=False):
+        try:
+            _next_check = now + settings.BIMA_RULESET_RELOAD_SECONDS
+            _reload()
+        except DatabaseError:
+            pass  # таблицы ещё нет (до migrate) — остаёмся на текущих правилах
+        finally:
+            _lock.release()
+    return _engine
+
+
+def engine_for_version(version=None) -> PricingEngine:
+    # движок конкретной версии правил (для пересчёта истории); None — действующий
+    if version is None:
+        return get_engine()
+    from .models import Ruleset
+
+    ruleset = Ruleset.objects.filter(version=version).first()
+    if ruleset is not None:
+        return ruleset.compile()
+    if version == DEFAULT_ENGINE.version:
+        return DEFAULT_ENGINE
+    raise Ruleset.DoesNotExist(f"нет набора правил {version}")
+
+
+def current_engine() -> PricingEngine:
+    # без сверки с БД — для кода, где get_engine() уже вызван в этом запросе
+    return _engine
+
+
+async def aget_engine() -> PricingEngine:
+    # для async view: сверка с БД (раз в BIMA_RULESET_RELOAD_SECONDS) — через поток
+    if time.monotonic() >= _next_check:
+        return await sync_to_async(get_engine)()
+    return _engine
@@ -0,0 +1,150 @@
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+HEADER = "HTTP_X_PROFILE"
+QUERY_PARAM = "_profile"
+REPORT_LINES = 80
+
+_lock = threading.Lock()
+_last_started = 0.0
+
+
+def _staff_user(request):
+    # middleware работает до DRF, поэтому JWT проверяем теми же классами аутентификации
+    drf_request = Request(request)
+    for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authenticator().authenticate(drf_request)
+        except APIException:
+            return None
+        if result is not None:
+            user = result[0]
+            return user if user.is_staff else None
+    return None
+
+
+def _acquire_slot():
+    # не больше одного профилируемого запроса за раз и не чаще BIMA_PROFILE_MIN_INTERVAL
+    global _last_started
+    if not _lock.acquire(blocking=False):
+        return False
+    now = time.monotonic()
+    if now - _last_started < settings.BIMA_PROFILE_MIN_INTERVAL:
+        _lock.release()
+        return False
+    _last_started = now
+    return True
+
+
+def _save(request, user, response, profilers, elapsed):
+    from .models import RequestProfile
+
+    # профайлеры разных потоков одного запроса сводятся в один отчёт
+    out = io.StringIO()
+    stats = pstats.Stats(*profilers, stream=out)
+    raw = marshal.dumps(stats.stats)
+    stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+    profile = RequestProfile.objects.create(
+        user_id=user.id,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        status_code=response.status_code,
+        duration_ms=elapsed * 1000,
+        report=out.getvalue(),
+        raw=raw,
+    )
+    stale = RequestProfile.objects.values_list("pk", flat=True)[settings.BIMA_PROFILE_KEEP:]
+    RequestProfile.objects.filter(pk__in=list(stale)).delete()
+    return profile
+
+
+class ProfilerMiddleware:
+    """cProfile для одного запроса по заголовку X-Profile: 1 или ?_profile=1.
+
+    Только для staff, не чаще раза в BIMA_PROFILE_MIN_INTERVAL секунд на
+    процесс. Результат сохраняется в RequestProfile (админка), его id —
+    в заголовке ответа X-Profile-Id. Без BIMA_PROFILING middleware
+    отключается целиком.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.BIMA_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _wanted(self, request):
+        # ровно X-Profile: 1 или ?_profile=1; X-Profile: 0, ?x_profile=1, ?_profile=10 — нет
+        return request.META.get(HEADER, "").strip() == "1" or request.GET.get(QUERY_PARAM) == "1"
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._wanted(request):
+            return self.get_response(request)
+        user = _staff_user(request)
+        if user is None or not _acquire_slot():
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+        finally:
+            _lock.release()
+        profile = _save(request, user, response, [profiler], elapsed)
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
+
+    async def __acall__(self, request):
+        if not self._wanted(request):
+            return await self.get_response(request)
+        user = await sync_to_async(_staff_user)(request)
+        if user is None or not _acquire_slot():
+            return await self.get_response(request)
+        # в ASGI профилируется поток event loop целиком — на время запроса
+        # в отчёт попадут и соседние корутины. Синхронные view DRF, сериализаторы
+        # и ORM выполняются в потоке sync_to_async этого запроса (thread_sensitive):
+        # до Python 3.12 cProfile видит только поток, где включён, поэтому там
+        # работает второй профайлер; с 3.12 cProfile (sys.monitoring) видит все потоки
+        profilers = [cProfile.Profile()]
+        if sys.version_info < (3, 12):
+            profilers.append(cProfile.Profile())
+        try:
+            started = time.perf_counter()
+            profilers[0].enable()
+            for profiler in profilers[1:]:
+                await sync_to_async(profiler.enable)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                for profiler in profilers[1:]:
+                    await sync_to_async(profiler.disable)()
+                profilers[0].disable()
+            elapsed = time.perf_counter() - started
+        finally:
+            _lock.release()
+        profile = await sync_to_async(_save)(request, user, response, profilers, elapsed)
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
@@ -0,0 +1,173 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from .pricing import PricingEngine
+from .utils import AGE_MIN
+
+FIELDS = ("tariff", "driver_age", "driver_experience", "car_type")
+
+_engine = None  # движок в процессе пула, см. _init_worker
+
+
+@dataclass
+class ReplayStats:
+    lines: int = 0
+    invalid: int = 0
+    compared: int = 0  # строки с сохранённым total_amount
+    changed: int = 0
+    increased: int = 0
+    old_total: Decimal = Decimal(0)
+    new_total: Decimal = Decimal(0)
+    # tariff -> [сравнено, сумма было, сумма стало]
+    by_tariff: dict = field(default_factory=dict)
+
+    def merge(self, other):
+        for name in ("lines", "invalid", "compared", "changed", "increased", "old_total", "new_total"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for tariff, (count, old, new) in other.by_tariff.items():
+            row = self.by_tariff.setdefault(tariff, [0, Decimal(0), Decimal(0)])
+            row[0] += count
+            row[1] += old
+            row[2] += new
+
+
+def _init_worker(rules):
+    global _engine
+    _engine = PricingEngine(**rules)
+
+
+def price_lines(lines, offset=0, engine=None, keep=False, want_diffs=False):
+    """Пересчитывает строки JSONL (bytes), offset — позиция первой строки в файле.
+
+    Строка — объект с tariff, driver_age, driver_experience, car_type и,
+    если есть, сохранённым total_amount (так выглядит export_bima --format
+    ndjson). Возвращает (ReplayStats, расхождения, пересчитанные строки
+    для сохранения — только при keep).
+    """
+    engine = engine or _engine
+    stats = ReplayStats()
+    diffs, priced = [], []
+    for line in lines:
+        line_offset, offset = offset, offset + len(line)
+        if not line.strip():
+            continue
+        stats.lines += 1
+        try:
+            entry = json.loads(line)
+            tariff, age, exp, car_type = (entry[name] for name in FIELDS)
+            age, exp = int(age), int(exp)
+            if exp > age - AGE_MIN:
+                raise ValueError("стаж больше возраста")
+            calc = engine.price(tariff, age, exp, car_type)
+            old = entry.get("total_amount")
+            old = None if old is None else Decimal(str(old))
+        except (ValueError, KeyError, TypeError, AttributeError, InvalidOperation):
+            stats.invalid += 1
+            continue
+        if keep:
+            priced.append((tariff, age, exp, car_type, calc))
+        if old is None:
+            continue
+        stats.compared += 1
+        stats.old_total += old
+        stats.new_total += calc.total
+        row = stats.by_tariff.setdefault(tariff, [0, Decimal(0), Decimal(0)])
+        row[0] += 1
+        row[1] += old
+        row[2] += calc.total
+        if calc.total != old:
+            stats.changed += 1
+            stats.increased += calc.total > old
+            if want_diffs:
+                diffs.append({
+                    "offset": line_offset, "id": entry.get("id"),
+                    "tariff": tariff, "driver_age": age, "driver_experience": exp, "car_type": car_type,
+                    "old_total": str(old), "new_total": str(calc.total),
+                })
+    return stats, diffs, priced
+
+
+def _read_range(path, start, end):
+    # строки, начинающиеся в [start, end); границы выровнены по \n в file_ranges
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        position = start
+        for line in fh:
+            if position >= end:
+                return
+            yield line
+            position += len(line)
+
+
+def price_range(path, start, end, *args):
+    # задача воркера: файл читает сам воркер, родитель передаёт только смещения
+    return price_lines(_read_range(path, start, end), start, None, *args)
+
+
+def file_ranges(path, size):
+    # куски файла по ~size байт, каждый заканчивается на границе строки
+    with open(path, "rb") as fh:
+        total = os.fstat(fh.fileno()).st_size
+        start = 0
+        while start < total:
+            fh.seek(min(start + size, total))
+            fh.readline()
+            end = min(fh.tell(), total)
+            yield start, end
+            start = end
+
+
+def _pooled(ranges, path, rules, workers, *args):
+    # в работе не больше 2×workers кусков — результаты идут в порядке файла
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(rules,)) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(price_range, path, start, end, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _batched(lines, size):
+    batch, offset, batch_offset = [], 0, 0
+    for line in lines:
+        batch.append(line)
+        offset += len(line)
+        if len(batch) == size:
+            yield batch, batch_offset
+            batch, batch_offset = [], offset
+    if batch:
+        yield batch, batch_offset
+
+
+def replay(source, engine, workers=1, batch_bytes=4 << 20, diff_out=None, on_priced=None):
+    """Пересчитывает JSONL движком engine, результаты — в порядке файла.
+
+    source — путь к файлу или бинарный поток (stdin; читается в этом
+    процессе). Файл делится на куски по batch_bytes, при workers > 1 они
+    считаются в пуле процессов. diff_out — текстовый файл для расхождений
+    (NDJSON); on_priced(rows) вызывается с пересчитанными строками куска.
+    """
+    stats = ReplayStats()
+    args = (on_priced is not None, diff_out is not None)
+    if not isinstance(source, str):
+        results = (price_lines(batch, offset, engine, *args) for batch, offset in _batched(source, 10_000))
+    elif workers > 1:
+        results = _pooled(file_ranges(source, batch_bytes), source, engine.rules, workers, *args)
+    else:
+        results = (
+            price_lines(_read_range(source, start, end), start, engine, *args)
+            for start, end in file_ranges(source, batch_bytes)
+        )
+    for batch_stats, diffs, priced in results:
+        stats.merge(batch_stats)
+        if diffs:
+            diff_out.writelines(json.dumps(d, ensure_ascii=False) + "\n" for d in diffs)
+        if on_priced is not None and priced:
+            on_priced(priced)
+    return stats
@@ -0,0 +1,111 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+DEFAULT_DB = "default"
+
+# алиас БД для чтения в текущем запросе; None — primary
+_read_alias = ContextVar("bima_read_alias", default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB]
+
+
+def pick_replica():
+    # случайная реплика на запрос; без реплик — primary
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases else DEFAULT_DB
+
+
+@contextmanager
+def read_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _pin_key(user_id):
+    return f"bima:pin:{user_id}"
+
+
+def _pins():
+    # кеш должен быть общим для воркеров (см. check bima.E001), иначе следующее
+    # чтение на другом воркере уйдёт на отстающую реплику
+    return caches[settings.BIMA_REPLICA_PIN_CACHE]
+
+
+def pin_primary(user_id):
+    # после записи пользователь читает с primary BIMA_REPLICA_PIN_SECONDS секунд
+    if replica_aliases() and settings.BIMA_REPLICA_PIN_SECONDS > 0:
+        _pins().set(_pin_key(user_id), 1, settings.BIMA_REPLICA_PIN_SECONDS)
+
+
+async def apin_primary(user_id):
+    if replica_aliases() and settings.BIMA_REPLICA_PIN_SECONDS > 0:
+        await _pins().aset(_pin_key(user_id), 1, settings.BIMA_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return _pins().get(_pin_key(user_id)) is not None
+
+
+async def ais_pinned(user_id):
+    return await _pins().aget(_pin_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    """Запись и миграции — только primary; чтение — туда, куда указал запрос.
+
+    Вне read_from()/ReplicaReadMixin все запросы идут на primary, так что
+    фоновые задачи, админка и проверки перед записью реплик не видят.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB
+
+
+class ReplicaReadMixin:
+    # list/retrieve viewset читают с реплики, если пользователь недавно не писал;
+    # успешный небезопасный запрос закрепляет пользователя за primary, чтобы
+    # он сразу видел собственные изменения (без docstring — он ушёл бы в OpenAPI)
+
+    replica_actions = ("list", "retrieve")
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and replica_aliases()
+            and not is_pinned(request.user.pk)
+        ):
+            _read_alias.set(pick_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            pin_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
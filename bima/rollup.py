@@ -0,0 +1,108 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Quote, Application, Summary, Tariff
+
+QUOTE, APPLICATION = Summary.Kind.QUOTE, Summary.Kind.APPLICATION
+MODELS = {QUOTE: Quote, APPLICATION: Application}
+STATUSES = {QUOTE: Quote.Status.values, APPLICATION: Application.Status.values}
+# поля строки для added/removed/moved: (user_id, tariff, status, сумма)
+ROW_FIELDS = {
+    QUOTE: ("user_id", "tariff", "status", "total_amount"),
+    APPLICATION: ("user_id", "tariff", "status", "total_amount_snapshot"),
+}
+
+
+def _bump(deltas):
+    # deltas: {(user_id, kind, tariff, status): [count, amount]}. Вызывать внутри
+    # транзакции, которая меняет сами строки, — счётчики фиксируются вместе с ними.
+    # Ключи по порядку: параллельные транзакции блокируют строки в одной очерёдности
+    for (user_id, kind, tariff, status), (count, amount) in sorted(deltas.items()):
+        if not count and not amount:
+            continue
+        row = Summary.objects.filter(user_id=user_id, kind=kind, tariff=tariff, status=status)
+        if row.update(count=F("count") + count, amount=F("amount") + amount):
+            continue
+        try:
+            with transaction.atomic():
+                Summary.objects.create(
+                    user_id=user_id, kind=kind, tariff=tariff, status=status, count=count, amount=amount,
+                )
+        except IntegrityError:
+            # строку только что вставил параллельный запрос
+            row.update(count=F("count") + count, amount=F("amount") + amount)
+
+
+def _deltas(kind, rows, sign, status=None):
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for user_id, tariff, old_status, amount in rows:
+        for key_status, key_sign in ((old_status, sign), (status, -sign)):
+            if key_status is None:
+                continue
+            delta = deltas[user_id, kind, tariff, key_status]
+            delta[0] += key_sign
+            delta[1] += key_sign * amount
+    return deltas
+
+
+def added(kind, rows):
+    _bump(_deltas(kind, rows, 1))
+
+
+def removed(kind, rows):
+    _bump(_deltas(kind, rows, -1))
+
+
+def moved(kind, rows, status):
+    # rows — строки в прежнем статусе, переведённые в status
+    _bump(_deltas(kind, rows, -1, status))
+
+
+def quote_rows(quotes):
+    return [(q.user_id, q.tariff, q.status, q.total_amount) for q in quotes]
+
+
+def application_rows(apps):
+    return [(a.user_id, a.tariff, a.status, a.total_amount_snapshot) for a in apps]
+
+
+def _empty():
+    return {"count": 0, "amount": Decimal("0.00")}
+
+
+def summary_for(user_id):
+    """Сводка пользователя: не больше 2×2×6 строк Summary, без сканов расчётов."""
+    result = {}
+    for kind, statuses in STATUSES.items():
+        result[kind] = {
+            **_empty(),
+            "by_status": {status: _empty() for status in statuses},
+            "by_tariff": {tariff: _empty() for tariff in Tariff.values},
+        }
+    rows = Summary.objects.filter(user_id=user_id).values_list("kind", "tariff", "status", "count", "amount")
+    for kind, tariff, status, count, amount in rows:
+        part = result[kind]
+        for bucket in (part, part["by_status"].setdefault(status, _empty()), part["by_tariff"].setdefault(tariff, _empty())):
+            bucket["count"] += count
+            bucket["amount"] += amount
+    return {"quotes": result[QUOTE], "applications": result[APPLICATION]}
+
+
+def rebuild(user_id=None):
+    # пересчёт с нуля агрегатами по таблицам; инкременты параллельных запросов
+    # во время пересборки могут потеряться — запускать в тихое время
+    rows = []
+    with transaction.atomic():
+        Summary.objects.filter(**({} if user_id is None else {"user_id": user_id})).delete()
+        for kind, model in MODELS.items():
+            queryset = model.objects.order_by()
+            if user_id is not None:
+                queryset = queryset.filter(user_id=user_id)
+            amount = ROW_FIELDS[kind][-1]
+            for row in queryset.values("user_id", "tariff", "status").annotate(count=Count("pk"), amount=Sum(amount)):
+                rows.append(Summary(kind=kind, **row))
+        Summary.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
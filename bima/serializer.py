@@ -1,17 +1,30 @@
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from rest_framework import serializers
+from rest_framework import ISO_8601
+from rest_framework.settings import api_settings
 # for the register auth user user in django default auth/user
 from django.contrib.auth import get_user_model, password_validation
+from django.contrib.auth.validators import UnicodeUsernameValidator
 
-from .models import Quote, Application, Tariff, CarType
-from .utils import (
-    BASE_PRICES, AGE_RANGES, EXP_RANGES, CAR_COEF,
-    pick_from_ranges, RULESET_VERSION, QUOTE_TTL_DAYS, Calculated
-)
+from . import etags, events, rollup
+from .models import Quote, Application, Ruleset, Tariff, CarType, QUOTE_FACTOR_SOURCES
+from .errors import Conflict, flatten_details
+from .metrics import TimedSerializerMixin
+from .pricing import get_engine, current_engine, engine_for_version, on_engine_change
+from .hashers import hash_password
+from .utils import QUOTE_TTL_DAYS, QUOTE_BATCH_MAX, PREVIEW_CACHE_SIZE, AGE_MIN, AGE_MAX, EXP_MIN, EXP_MAX
 from datetime import timedelta
 
+User = get_user_model()
+
 
-class QuoteCreateSerializer(serializers.ModelSerializer):
+class QuoteCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Quote
         fields = ("id", "tariff", "driver_age", "driver_experience", "car_type")
@@ -20,39 +33,157 @@ class QuoteCreateSerializer(serializers.ModelSerializer):
     def validate(self, data):
         age = data["driver_age"]
         exp = data["driver_experience"]
-        if not (18 <= age <= 100):
-            raise serializers.ValidationError({"driver_age": "18..100"})
-        if not (0 <= exp <= 80):
-            raise serializers.ValidationError({"driver_experience": "0..80"})
-        if exp > age - 18:
+        if not (AGE_MIN <= age <= AGE_MAX):
+            raise serializers.ValidationError({"driver_age": f"{AGE_MIN}..{AGE_MAX}"})
+        if not (EXP_MIN <= exp <= EXP_MAX):
+            raise serializers.ValidationError({"driver_experience": f"{EXP_MIN}..{EXP_MAX}"})
+        if exp > age - AGE_MIN:
             raise serializers.ValidationError({"driver_experience": "не может быть > age-18"})
         return data
 
     def create(self, validated):
         user = self.context["request"].user
-        # расчёт
-        base = float(BASE_PRICES[validated["tariff"]])
-        c_age = pick_from_ranges(validated["driver_age"], AGE_RANGES)
-        c_exp = pick_from_ranges(validated["driver_experience"], EXP_RANGES)
-        c_car = float(CAR_COEF[validated["car_type"]])
-        total = round(base * c_age * c_exp * c_car, 2)
-
-        return Quote.objects.create(
-            user=user,
-            **validated,
-            base_amount=base,
-            coef_age=c_age,
-            coef_exp=c_exp,
-            coef_car=c_car,
-            total_amount=total,
-            currency="TJS",
-            ruleset_version=RULESET_VERSION,
-            valid_until=timezone.now() + timedelta(days=QUOTE_TTL_DAYS),
-            status=Quote.Status.ACTIVE,
+        quote = build_quote(user.id, validated, get_engine())
+        save_quotes([quote])
+        return quote
+
+
+def build_quote(user_id, validated, engine, calc=None, valid_until=None):
+    # несохранённый Quote по проверенным входным данным; общий для одиночного,
+    # пакетного и асинхронного создания
+    if calc is None:
+        calc = engine.price(
+            validated["tariff"], validated["driver_age"],
+            validated["driver_experience"], validated["car_type"],
+        )
+    return Quote(
+        user_id=user_id,
+        **validated,
+        base_amount=calc.base,
+        coef_age=calc.c_age,
+        coef_exp=calc.c_exp,
+        coef_car=calc.c_car,
+        total_amount=calc.total,
+        currency=engine.currency,
+        ruleset_version=engine.version,
+        valid_until=valid_until or timezone.now() + timedelta(days=QUOTE_TTL_DAYS),
+        status=Quote.Status.ACTIVE,
+    )
+
+
+def save_quotes(quotes, batch_size=None):
+    # расчёты и счётчики сводки (bima/rollup.py) — одной транзакцией
+    with transaction.atomic():
+        Quote.objects.bulk_create(quotes, batch_size=batch_size)
+        rollup.added(rollup.QUOTE, rollup.quote_rows(quotes))
+
+
+class QuotePreviewSerializer(QuoteCreateSerializer):
+    # база/коэффициенты/валюта/версия — атрибуты Quote поверх QuoteFactors, а не
+    # колонки, поэтому поля объявлены явно с прежними параметрами
+    base_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    coef_age = serializers.DecimalField(max_digits=6, decimal_places=3, read_only=True)
+    coef_exp = serializers.DecimalField(max_digits=6, decimal_places=3, read_only=True)
+    coef_car = serializers.DecimalField(max_digits=6, decimal_places=3, read_only=True)
+    currency = serializers.CharField(read_only=True)
+    ruleset_version = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Quote
+        fields = (
+            "tariff", "driver_age", "driver_experience", "car_type",
+            "base_amount", "coef_age", "coef_exp", "coef_car",
+            "total_amount", "currency", "ruleset_version",
+        )
+        read_only_fields = (
+            "base_amount", "coef_age", "coef_exp", "coef_car",
+            "total_amount", "currency", "ruleset_version",
+        )
+
+
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def _preview_data(tariff, age, exp, car_type, version):
+    # version входит в ключ: смена набора правил не отдаёт старые ответы;
+    # сверку с БД уже сделал вызывающий (preview_data / aget_engine)
+    engine = current_engine()
+    calc = engine.price(tariff, age, exp, car_type)
+    return dict(QuotePreviewSerializer({
+        "tariff": tariff,
+        "driver_age": age,
+        "driver_experience": exp,
+        "car_type": car_type,
+        "base_amount": calc.base,
+        "coef_age": calc.c_age,
+        "coef_exp": calc.c_exp,
+        "coef_car": calc.c_car,
+        "total_amount": calc.total,
+        "currency": engine.currency,
+        "ruleset_version": version,
+    }).data)
+
+
+# правила поменялись (в т.ч. правка той же версии в админке) — старые ответы не годятся
+on_engine_change(_preview_data.cache_clear)
+
+
+def preview_data(validated, engine=None):
+    engine = engine or get_engine()
+    return _preview_data(
+        validated["tariff"], validated["driver_age"],
+        validated["driver_experience"], validated["car_type"],
+        engine.version,
+    )
+
+
+class QuoteBatchSerializer(TimedSerializerMixin, serializers.Serializer):
+    items = serializers.ListField(allow_empty=False, max_length=QUOTE_BATCH_MAX)
+
+    def validate(self, data):
+        # каждая позиция проверяется теми же правилами, что и одиночный расчёт;
+        # ошибки копим по индексам, а не валим весь пакет
+        child = QuoteCreateSerializer(context=self.context)
+        valid, errors = [], []
+        for index, item in enumerate(data["items"]):
+            try:
+                valid.append((index, child.run_validation(item)))
+            except serializers.ValidationError as e:
+                detail = e.detail if isinstance(e.detail, dict) else {"non_field_errors": e.detail}
+                errors.append({"index": index, "details": flatten_details(detail)})
+        return {"valid": valid, "errors": errors}
+
+    def create(self, validated):
+        user = self.context["request"].user
+        engine = get_engine()
+        valid = validated["valid"]
+        calcs = engine.price_many(
+            (v["tariff"], v["driver_age"], v["driver_experience"], v["car_type"])
+            for _, v in valid
         )
+        valid_until = timezone.now() + timedelta(days=QUOTE_TTL_DAYS)
+        quotes = [
+            build_quote(user.id, v, engine, calc, valid_until)
+            for (_, v), calc in zip(valid, calcs)
+        ]
+        save_quotes(quotes)
+
+        created = [
+            {"index": index, "id": str(q.id), "total_amount": f"{q.total_amount:f}"}
+            for (index, _), q in zip(valid, quotes)
+        ]
+        return {"created": created, "errors": validated["errors"]}
 
+    def to_representation(self, result):
+        return result
+
+
+class QuoteDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    base_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    coef_age = serializers.DecimalField(max_digits=6, decimal_places=3)
+    coef_exp = serializers.DecimalField(max_digits=6, decimal_places=3)
+    coef_car = serializers.DecimalField(max_digits=6, decimal_places=3)
+    currency = serializers.CharField(max_length=3, required=False)
+    ruleset_version = serializers.CharField(max_length=16, required=False)
 
-class QuoteDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quote
         fields = (
@@ -63,42 +194,191 @@ class QuoteDetailSerializer(serializers.ModelSerializer):
         )
 
 
-class ApplicationCreateSerializer(serializers.ModelSerializer):
+
+def _row_formatter(field, tz):
+    # повторяет field.to_representation для значений из values(); None — как есть
+    if (
+        isinstance(field, serializers.DateTimeField)
+        and getattr(field, "format", api_settings.DATETIME_FORMAT) == ISO_8601
+    ):
+        def iso(value):
+            value = (value.astimezone(tz) if tz else value).isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+        return iso
+    if (
+        isinstance(field, serializers.DecimalField)
+        and getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+        and not (field.localize or field.normalize_output)
+    ):
+        exp = Decimal(1).scaleb(-field.decimal_places)
+        return lambda value: format(value.quantize(exp, rounding=field.rounding), "f")
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, (serializers.CharField, serializers.ChoiceField, serializers.StringRelatedField)):
+        return str
+    if isinstance(field, (serializers.PrimaryKeyRelatedField, serializers.JSONField, serializers.UUIDField)):
+        return None
+    return field.to_representation
+
+
+class _RowList(serializers.ListSerializer):
+    _fields = {}
+
+    def row_fields(self):
+        child = type(self.child)
+        if child not in self._fields:
+            self._fields[child] = [
+                (name, child.row_sources.get(name, name), field)
+                for name, field in self.child.fields.items()
+                if not field.write_only
+            ]
+        return self._fields[child]
+
+    def to_representation(self, data):
+        # часовой пояс — один раз на список, а не на каждое значение
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        plan = [(name, key, _row_formatter(field, tz)) for name, key, field in self.row_fields()]
+        return [
+            {
+                name: row[key] if fmt is None or row[key] is None else fmt(row[key])
+                for name, key, fmt in plan
+            }
+            for row in data
+        ]
+
+
+class RowListSerializer(TimedSerializerMixin, _RowList):
+    """many=True по строкам queryset.values(): без DRF-полей на каждую строку.
+
+    Форматтеры строятся один раз на класс по объявленным полям child и
+    повторяют их to_representation, поэтому ответ совпадает с обычным
+    сериализатором байт в байт. Ключи строк — child.row_sources или имя поля.
+    """
+
+
+class RowSerializerMixin:
+    # ключи values() для полей, которые читаются через связь
+    row_sources = {}
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*(cls.row_sources.get(name, name) for name in cls.Meta.fields))
+
+
+class QuoteListSerializer(RowSerializerMixin, QuoteDetailSerializer):
+    row_sources = QUOTE_FACTOR_SOURCES
+
+    class Meta(QuoteDetailSerializer.Meta):
+        list_serializer_class = RowListSerializer
+
+class ListFilterSerializer(serializers.Serializer):
+    tariff = serializers.ChoiceField(choices=Tariff.choices, required=False)
+    created_from = serializers.DateTimeField(required=False, help_text="created_at >= (ISO 8601)")
+    created_to = serializers.DateTimeField(required=False, help_text="created_at < (ISO 8601)")
+
+
+class QuoteFilterSerializer(ListFilterSerializer):
+    status = serializers.ChoiceField(choices=Quote.Status.choices, required=False)
+
+
+class SimulationSerializer(QuoteFilterSerializer):
+    # кандидат — сохранённая версия (ruleset) или правила целиком (rules, поля как у Ruleset)
+    ruleset = serializers.CharField(required=False)
+    rules = serializers.JSONField(required=False)
+
+    RULE_FIELDS = ("base_prices", "age_ranges", "exp_ranges", "car_coef", "currency")
+
+    def validate(self, data):
+        if ("ruleset" in data) == ("rules" in data):
+            raise serializers.ValidationError("нужно ровно одно из полей: ruleset, rules")
+        if "ruleset" in data:
+            try:
+                data["engine"] = engine_for_version(data["ruleset"])
+            except Ruleset.DoesNotExist as e:
+                raise serializers.ValidationError({"ruleset": str(e)})
+            return data
+        rules = data["rules"]
+        if not isinstance(rules, dict):
+            raise serializers.ValidationError({"rules": "ожидается объект"})
+        candidate = Ruleset(
+            version=str(rules.get("version", "candidate")),
+            **{name: rules[name] for name in self.RULE_FIELDS if name in rules},
+        )
+        try:
+            candidate.clean()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({"rules": "; ".join(e.messages)})
+        data["engine"] = candidate.compile()
+        return data
+
+
+class ApplicationFilterSerializer(ListFilterSerializer):
+    status = serializers.ChoiceField(choices=Application.Status.choices, required=False)
+
+
+class ApplicationCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Application
         fields = ("id", "full_name", "phone", "email", "tariff", "quote")
         read_only_fields = ("id",)
+        # без UniqueValidator по OneToOne: уникальность держат условный UPDATE
+        # и ограничение в БД (см. create_application), лишний SELECT не нужен
+        extra_kwargs = {"quote": {"validators": []}}
 
     def validate(self, data):
-        quote = data["quote"]
-        user = self.context["request"].user
-        if quote.user_id != user.id:
-            raise serializers.ValidationError({"quote": "чужой расчёт"})
-        if quote.status != Quote.Status.ACTIVE:
-            raise serializers.ValidationError({"quote": f"недопустимый статус {quote.status}"})
-        if quote.valid_until <= timezone.now():
-            raise serializers.ValidationError({"quote": "просрочен"})
+        check_quote(data["quote"], self.context["request"].user.id)
         return data
 
     def create(self, validated):
-        user = self.context["request"].user
-        quote = validated["quote"]
-
-        app = Application.objects.create(
-            user=user,
-            quote=quote,
-            full_name=validated["full_name"],
-            phone=validated["phone"],
-            email=validated["email"],
-            tariff=validated["tariff"],
-            total_amount_snapshot=quote.total_amount,
-        )
-        quote.status = Quote.Status.USED
-        quote.save(update_fields=["status"])
-        return app
+        return create_application(self.context["request"].user.id, validated)
+
+
+def check_quote(quote, user_id):
+    if quote.user_id != user_id:
+        raise serializers.ValidationError({"quote": "чужой расчёт"})
+    if quote.status != Quote.Status.ACTIVE:
+        raise serializers.ValidationError({"quote": f"недопустимый статус {quote.status}"})
+    if quote.valid_until <= timezone.now():
+        raise serializers.ValidationError({"quote": "просрочен"})
+
 
+def create_application(user_id, validated):
+    quote = validated["quote"]
+    # check_quote() проверил расчёт по снимку; окончательно его занимает
+    # условный UPDATE в одной транзакции со вставкой заявки —
+    # из параллельных запросов на один расчёт пройдёт ровно один
+    try:
+        with transaction.atomic():
+            taken = Quote.objects.filter(
+                pk=quote.pk,
+                user_id=user_id,
+                status=Quote.Status.ACTIVE,
+                valid_until__gt=timezone.now(),
+            ).update(status=Quote.Status.USED)
+            if not taken:
+                raise Conflict({"quote": "расчёт уже использован или просрочен"})
+            app = Application.objects.create(
+                user_id=user_id,
+                quote=quote,
+                full_name=validated["full_name"],
+                phone=validated["phone"],
+                email=validated["email"],
+                tariff=validated["tariff"],
+                total_amount_snapshot=quote.total_amount,
+            )
+            rollup.moved(
+                rollup.QUOTE, [(user_id, quote.tariff, Quote.Status.ACTIVE, quote.total_amount)], Quote.Status.USED,
+            )
+            rollup.added(rollup.APPLICATION, rollup.application_rows([app]))
+            etags.invalidate(etags.QUOTE, [(user_id, quote.pk)])
+            events.record([(user_id, app.pk, app.status)])
+    except IntegrityError:
+        raise Conflict({"quote": "по расчёту уже создана заявка"})
+    quote.status = Quote.Status.USED
+    return app
 
-class ApplicationDetailSerializer(serializers.ModelSerializer):
+
+class ApplicationDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     class Meta:
         model = Application
@@ -108,10 +388,31 @@ class ApplicationDetailSerializer(serializers.ModelSerializer):
         )
 
 
-User = get_user_model()
+class ApplicationListSerializer(RowSerializerMixin, ApplicationDetailSerializer):
+    # str(user) == username: одна таблица через JOIN вместо запроса на строку
+    row_sources = {"user": f"user__{User.USERNAME_FIELD}"}
+
+    class Meta(ApplicationDetailSerializer.Meta):
+        list_serializer_class = RowListSerializer
+
+
+
+class SummaryBucketSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=16, decimal_places=2)
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class SummaryPartSerializer(SummaryBucketSerializer):
+    by_status = serializers.DictField(child=SummaryBucketSerializer())
+    by_tariff = serializers.DictField(child=SummaryBucketSerializer())
+
+
+class SummarySerializer(serializers.Serializer):
+    quotes = SummaryPartSerializer()
+    applications = SummaryPartSerializer()
+
+
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True,
         min_length=6,
@@ -121,16 +422,8 @@ class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("username", "email", "password")
-
-    def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError("Пользователь с таким username уже существует.")
-        return value
-
-    def validate_email(self, value):
-        if value and User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Пользователь с таким email уже существует.")
-        return value
+        # занятость username/email проверяют уникальные индексы при вставке (insert_user)
+        extra_kwargs = {"username": {"validators": [UnicodeUsernameValidator()]}}
 
     def validate(self, attrs):
         # проверка пароля стандартными правилами Django
@@ -138,15 +431,42 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data["username"],
-            email=validated_data.get("email") or "",
-            password=validated_data["password"],
-        )
-        user.is_active = True
-        user.save(update_fields=["is_active"])
-        return user
-    
+        return insert_user(new_user(validated_data, hash_password(validated_data["password"])))
+
+
+def new_user(validated_data, password_hash):
+    # как UserManager.create_user, но хеш пароля уже посчитан (bima.hashers)
+    return User(
+        username=User.normalize_username(validated_data["username"]),
+        email=User.objects.normalize_email(validated_data.get("email") or ""),
+        password=password_hash,
+    )
+
+
+EMAIL_CONSTRAINT = "auth_user_email_uniq"  # миграция 0007
+
+
+def _violated_email(exc):
+    # поле определяем по имени ограничения, а не по тексту ошибки: в тексте
+    # Postgres есть само значение, и username "email_fan" выглядел бы как email
+    diag = getattr(exc.__cause__, "diag", None)
+    if diag is not None:
+        return diag.constraint_name == EMAIL_CONSTRAINT
+    # SQLite называет колонку: "UNIQUE constraint failed: auth_user.email"
+    return str(exc).rsplit(":", 1)[-1].strip() == "auth_user.email"
+
+
+def insert_user(user):
+    # один INSERT без SELECT перед ним: занятый username — уникальный индекс
+    # auth_user, занятый email — auth_user_email_uniq
+    try:
+        with transaction.atomic():
+            user.save(force_insert=True)
+    except IntegrityError as exc:
+        field = "email" if _violated_email(exc) else "username"
+        raise serializers.ValidationError({field: f"Пользователь с таким {field} уже существует."})
+    return user
+
 
 class RegisterResponseSerializer(serializers.Serializer):
     id = serializers.IntegerField()
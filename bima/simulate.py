@@ -0,0 +1,97 @@
+import math
+from decimal import Decimal
+from operator import itemgetter
+
+from django.db.models import Count
+
+from .pricing import CENT
+
+GROUP_FIELDS = ("tariff", "driver_age", "driver_experience", "car_type", "total_amount")
+PERCENTILES = (5, 25, 50, 75, 95, 99)
+
+
+def input_groups(queryset):
+    # GROUP BY входов и старой цены прямо в БД: различных комбинаций —
+    # тысячи даже на десятках миллионов расчётов, модели не создаются
+    return queryset.order_by().values_list(*GROUP_FIELDS).annotate(n=Count("pk"))
+
+
+def _percentiles(weighted, total):
+    # weighted: [(значение, число расчётов)]; метод ближайшего ранга
+    weighted.sort(key=itemgetter(0))
+    items = iter(weighted)
+    result, seen, value = {}, 0, None
+    for p in PERCENTILES:
+        rank = max(1, math.ceil(p * total / 100))
+        while seen < rank:
+            value, n = next(items)
+            seen += n
+        result[f"p{p}"] = f"{value:f}"
+    return result
+
+
+def _summary(weighted, total, amount):
+    mean = (amount / total).quantize(CENT) if total else Decimal("0.00")
+    summary = {"total": f"{amount:f}", "mean": f"{mean:f}"}
+    if total:
+        summary.update(_percentiles(weighted, total))
+    return summary
+
+
+def _share(old, new):
+    return round(float((new - old) / old * 100), 2) if old else None
+
+
+def simulate(queryset, engine):
+    """Как изменились бы цены расчётов queryset по правилам engine.
+
+    Каждая группа одинаковых входов пересчитывается один раз, статистика
+    (суммы, среднее, перцентили) взвешивается числом расчётов в группе.
+    Входы, которых нет в правилах engine (например, удалённый тариф),
+    попадают в skipped.
+    """
+    count = skipped = changed = increased = 0
+    old_sum = new_sum = Decimal("0.00")
+    olds, news, deltas = [], [], []
+    by_tariff, by_car_type = {}, {}
+    price = engine.price
+    for tariff, age, exp, car_type, old, n in input_groups(queryset):
+        try:
+            new = price(tariff, age, exp, car_type).total
+        except ValueError:
+            skipped += n
+            continue
+        count += n
+        old_sum += old * n
+        new_sum += new * n
+        olds.append((old, n))
+        news.append((new, n))
+        deltas.append((new - old, n))
+        if new != old:
+            changed += n
+            increased += n if new > old else 0
+        for key, groups in ((tariff, by_tariff), (car_type, by_car_type)):
+            row = groups.setdefault(key, [0, Decimal(0), Decimal(0)])
+            row[0] += n
+            row[1] += old * n
+            row[2] += new * n
+
+    def breakdown(groups):
+        return {
+            key: {"quotes": n, "old_total": f"{old:f}", "new_total": f"{new:f}", "delta_pct": _share(old, new)}
+            for key, (n, old, new) in sorted(groups.items())
+        }
+
+    return {
+        "ruleset_version": engine.version,
+        "quotes": count,
+        "skipped": skipped,
+        "changed": changed,
+        "increased": increased,
+        "delta_pct": _share(old_sum, new_sum),
+        "old": _summary(olds, count, old_sum),
+        "new": _summary(news, count, new_sum),
+        "delta": _summary(deltas, count, new_sum - old_sum),
+        "by_tariff": breakdown(by_tariff),
+        "by_car_type": breakdown(by_car_type),
+    }
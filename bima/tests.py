@@ -1,3 +1,541 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.checks import run_checks
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from . import etags, events, expiry, export, models, pricing, replay, rollup, serializer, throttling
+from .errors import Conflict
+from .models import Application, ApplicationEvent, Quote, Ruleset
+from .pricing import PricingEngine, engine_for_version
+from .serializer import ApplicationCreateSerializer, QuoteDetailSerializer
+
+User = get_user_model()
+QUOTE = {"tariff": "OSAGO", "driver_age": 24, "driver_experience": 2, "car_type": "suv"}
+
+
+class ApiTestCase(APITestCase):
+    def setUp(self):
+        # состояние процесса между тестами: ответы Idempotency-Key, ETag,
+        # счётчики лимитов и кеш QuoteFactors (id после отката переиспользуются)
+        for cache in caches.all():
+            cache.clear()
+        patcher = mock.patch.object(throttling, "_local", throttling.LocalBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        models._factors_by_id.clear()
+        models._factors_by_key.clear()
+        self.user = User.objects.create_user("broker", password="pw123456", email="b@example.com")
+        self.client.force_authenticate(self.user)
+
+    def create_quote(self, **data):
+        response = self.client.post("/api/v1/quotes/", {**QUOTE, **data}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def application(self, quote_id):
+        return {"full_name": "Али Валиев", "phone": "+992900000000", "email": "a@example.com",
+                "tariff": "OSAGO", "quote": quote_id}
+
+
+class RulesetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        # следующий get_engine() сверится с БД, в том числе после теста
+        pricing._next_check = 0
+        self.addCleanup(setattr, pricing, "_next_check", 0)
+
+    def ruleset(self, version, effective_from, **rules):
+        return Ruleset.objects.create(
+            effective_from=effective_from, **{**pricing.DEFAULT_ENGINE.rules, "version": version, **rules},
+        )
+
+    def test_saved_rules_are_read_only(self):
+        ruleset = Ruleset.objects.get(pk=self.ruleset("v2", timezone.now()).pk)
+        ruleset.base_prices = {**ruleset.base_prices, "OSAGO": 1}
+        with self.assertRaises(ValidationError) as caught:
+            ruleset.full_clean()
+        self.assertEqual(list(caught.exception.message_dict), ["base_prices"])
+        # дата начала действия — не правила, её менять можно
+        ruleset.refresh_from_db()
+        ruleset.effective_from -= timedelta(days=1)
+        ruleset.full_clean()
+
+    def priced(self):
+        return self.client.get(f"/api/v1/quotes/{self.create_quote()['id']}/").json()
+
+    def test_new_version_is_picked_up_without_restart(self):
+        self.assertEqual(self.priced()["ruleset_version"], "v1")
+        self.ruleset("v2", timezone.now() - timedelta(seconds=1),
+                     base_prices={**pricing.DEFAULT_ENGINE.rules["base_prices"], "OSAGO": 2000})
+        # сверка с БД — раз в BIMA_RULESET_RELOAD_SECONDS; не ждём интервала
+        pricing._next_check = 0
+        quote = self.priced()
+        self.assertEqual(quote["ruleset_version"], "v2")
+        self.assertEqual(quote["base_amount"], "2000.00")
+        # версия из будущего ещё не действует
+        self.ruleset("v3", timezone.now() + timedelta(days=1), base_prices={"OSAGO": 1, "KASKO": 1})
+        pricing._next_check = 0
+        self.assertEqual(self.priced()["ruleset_version"], "v2")
+
+
+class ApplicationClaimTests(ApiTestCase):
+    def test_second_application_for_quote_is_rejected(self):
+        quote = self.create_quote()
+        first = self.client.post("/api/v1/applications/", self.application(quote["id"]), format="json")
+        second = self.client.post("/api/v1/applications/", self.application(quote["id"]), format="json")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 400)
+        self.assertIn("quote", second.json()["error"]["details"])
+        self.assertEqual(Application.objects.filter(quote_id=quote["id"]).count(), 1)
+
+    def test_quote_claimed_after_validation_conflicts(self):
+        # параллельный запрос занял расчёт между проверкой и записью
+        quote = self.create_quote()
+        request = APIRequestFactory().post("/")
+        request.user = self.user
+        serializer = ApplicationCreateSerializer(data=self.application(quote["id"]), context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        Quote.objects.filter(pk=quote["id"]).update(status=Quote.Status.USED)
+        with self.assertRaises(Conflict):
+            serializer.save()
+        self.assertFalse(Application.objects.exists())
+
+
+class IdempotencyTests(ApiTestCase):
+    def test_same_key_replays_response(self):
+        first = self.client.post("/api/v1/quotes/", QUOTE, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        second = self.client.post("/api/v1/quotes/", QUOTE, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(Quote.objects.count(), 1)
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.client.post("/api/v1/quotes/", QUOTE, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        response = self.client.post(
+            "/api/v1/quotes/", {**QUOTE, "driver_age": 30}, format="json", HTTP_IDEMPOTENCY_KEY="k1",
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Quote.objects.count(), 1)
+
+
+class CursorPaginationTests(ApiTestCase):
+    def test_pages_have_no_gaps_or_duplicates(self):
+        # пакет — много расчётов с одинаковым created_at: порядок держится на id
+        items = [{**QUOTE, "tariff": tariff} for tariff in ("OSAGO", "KASKO") * 25]
+        self.assertEqual(self.client.post("/api/v1/quotes/batch/", {"items": items}, format="json").status_code, 201)
+        seen, url = [], "/api/v1/quotes/?page_size=7"
+        while url:
+            page = self.client.get(url).json()
+            seen += [row["id"] for row in page["results"]]
+            url = page["next"]
+        expected = [str(pk) for pk in Quote.objects.order_by("-created_at", "-pk").values_list("pk", flat=True)]
+        self.assertEqual(seen, expected)
+
+    def test_filtered_pages(self):
+        items = [{**QUOTE, "tariff": tariff} for tariff in ("OSAGO", "KASKO") * 10]
+        self.client.post("/api/v1/quotes/batch/", {"items": items}, format="json")
+        seen, url = [], "/api/v1/quotes/?page_size=3&tariff=KASKO"
+        while url:
+            page = self.client.get(url).json()
+            seen += [row["id"] for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+
+
+class ListRowsTests(ApiTestCase):
+    def test_list_rows_match_detail(self):
+        for age in (20, 24, 40, 70):
+            quote = self.create_quote(driver_age=age, car_type="sport")
+        self.client.post("/api/v1/applications/", self.application(quote["id"]), format="json")
+        for kind in ("quotes", "applications"):
+            rows = self.client.get(f"/api/v1/{kind}/").json()["results"]
+            self.assertTrue(rows)
+            for row in rows:
+                self.assertEqual(row, self.client.get(f"/api/v1/{kind}/{row['id']}/").json())
+
+
+class ThrottleTests(ApiTestCase):
+    def test_create_over_limit_is_throttled(self):
+        rates = {**settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "quotes": "2/min"}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}):
+            codes = [self.client.post("/api/v1/quotes/", QUOTE, format="json").status_code for _ in range(3)]
+            self.assertEqual(codes, [201, 201, 429])
+            response = self.client.post("/api/v1/quotes/", QUOTE, format="json")
+            self.assertEqual(response.status_code, 429)
+            self.assertIn("Retry-After", response.headers)
+            # чтение не ограничивается
+            self.assertEqual(self.client.get("/api/v1/quotes/").status_code, 200)
+
+
+class WriterInBetween:
+    # кеш, в который параллельный писатель ставит метку сразу после того, как
+    # читатель заглянул в кеш, или перед его записью, если он не заглядывает
+    def __init__(self, cache, write):
+        self.cache, self.write = cache, write
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+
+        def call(*args, **kwargs):
+            if name == "get":
+                result = method(*args, **kwargs)
+                self._write()
+                return result
+            self._write()
+            return method(*args, **kwargs)
+        return call
+
+    def _write(self):
+        write, self.write = self.write, None
+        if write:
+            write()
+
+
+class EtagTests(ApiTestCase):
+    def test_row_read_before_change_does_not_replace_tombstone(self):
+        quote = self.create_quote()
+        stale = Quote.objects.get(pk=quote["id"])
+        etag = etags.ETAGS[etags.QUOTE](stale)
+
+        def apply():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post("/api/v1/applications/", self.application(quote["id"]), format="json")
+        cache = WriterInBetween(etags._cache(), apply)
+        with mock.patch.object(etags, "_cache", lambda: cache):
+            self.assertEqual(etags.remember(etags.QUOTE, self.user.id, stale), etag)
+
+        key = etags.cache_key(etags.QUOTE, self.user.id, stale.pk)
+        self.assertEqual(etags._cache().get(key), etags.TOMBSTONE)
+        response = self.client.get(f"/api/v1/quotes/{quote['id']}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "USED")
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_replica_row_is_not_cached(self):
+        quote = Quote.objects.get(pk=self.create_quote()["id"])
+        quote._state.db = "replica"
+        etag = etags.remember(etags.QUOTE, self.user.id, quote)
+        self.assertEqual(etag, etags.ETAGS[etags.QUOTE](quote))
+        self.assertIsNone(etags._cache().get(etags.cache_key(etags.QUOTE, self.user.id, quote.pk)))
+
+
+class ExpiryTests(ApiTestCase):
+    def test_stale_quotes_expire_in_chunks(self):
+        ids = [self.create_quote()["id"] for _ in range(5)]
+        Quote.objects.filter(pk__in=ids[:3]).update(valid_until=timezone.now() - timedelta(minutes=1))
+        with mock.patch.object(rollup, "moved", wraps=rollup.moved) as moved:
+            self.assertEqual(expiry.expire_quotes(chunk_size=2), 3)
+        self.assertEqual([len(call.args[1]) for call in moved.call_args_list], [2, 1])
+        statuses = [Quote.objects.get(pk=pk).status for pk in ids]
+        self.assertEqual(statuses, ["EXPIRED"] * 3 + ["ACTIVE"] * 2)
+        self.assertEqual(expiry.expire_quotes(chunk_size=2), 0)
+
+    def test_one_sweep_per_interval_across_workers(self):
+        # третий sleep прерывает цикл: первый тик берёт аренду, второй видит её занятой
+        class Stop(Exception):
+            pass
+
+        with mock.patch.object(expiry.time, "sleep", side_effect=[None, None, Stop]), \
+                mock.patch.object(expiry, "sweep", return_value={}) as sweep, \
+                mock.patch.object(expiry, "close_old_connections"):
+            with self.assertRaises(Stop):
+                expiry._run_periodically(60, None)
+        self.assertEqual(sweep.call_count, 1)
+        self.assertEqual(caches[settings.BIMA_EXPIRY_LOCK_CACHE].get(expiry.LOCK_KEY), os.getpid())
+
+
+class ReplayTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engine = engine_for_version()
+        total = self.engine.price("OSAGO", 24, 2, "suv").total
+        lines = [
+            {**QUOTE, "total_amount": str(total)},
+            {**QUOTE, "id": "q2", "total_amount": str(total - 10)},
+            {**QUOTE, "driver_experience": 10},  # стаж больше возраста
+            {**QUOTE, "tariff": "KASKO"},  # без total_amount — только пересчёт
+        ]
+        self.data = "".join(json.dumps(line) + "\n" for line in lines).encode() + b"\n{broken\n"
+        fh = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        fh.write(self.data)
+        fh.close()
+        self.path = fh.name
+        self.addCleanup(os.remove, self.path)
+
+    def check(self, stats, diffs):
+        self.assertEqual((stats.lines, stats.invalid, stats.compared, stats.changed), (5, 2, 2, 1))
+        self.assertEqual(stats.increased, 1)
+        self.assertEqual(stats.new_total - stats.old_total, 10)
+        self.assertEqual([json.loads(d)["id"] for d in diffs], ["q2"])
+        offset = json.loads(diffs[0])["offset"]
+        self.assertEqual(json.loads(self.data[offset:].split(b"\n")[0])["id"], "q2")
+
+    def test_file_in_small_ranges_and_stream_agree(self):
+        for source, workers in ((self.path, 1), (self.path, 2), (io.BytesIO(self.data), 1)):
+            with self.subTest(source=source, workers=workers):
+                out = io.StringIO()
+                stats = replay.replay(source, self.engine, workers, batch_bytes=64, diff_out=out)
+                self.check(stats, out.getvalue().splitlines())
+
+    def test_persist_saves_expired_quotes(self):
+        call_command("replay_quotes", self.path, "--workers", "1", "--persist", "broker", stdout=io.StringIO())
+        self.assertEqual(Quote.objects.filter(user=self.user, status="EXPIRED").count(), 3)
+        self.assertEqual(self.client.get("/api/v1/summary/").json()["quotes"]["by_status"]["EXPIRED"]["count"], 3)
+
+
+class SimulateTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save(update_fields=["is_staff"])
+        for tariff in ("OSAGO", "OSAGO", "OSAGO", "KASKO"):
+            self.create_quote(tariff=tariff)
+        self.rules = {**engine_for_version().rules, "version": "cand"}
+        self.rules["base_prices"] = {**self.rules["base_prices"], "OSAGO": 1100}
+
+    def simulate(self, **data):
+        return self.client.post("/api/v1/quotes/simulate", data, format="json")
+
+    def test_candidate_rules_change_only_their_tariff(self):
+        response = self.simulate(rules=self.rules)
+        self.assertEqual(response.status_code, 200, response.content)
+        result = response.json()
+        old = engine_for_version().price("OSAGO", 24, 2, "suv").total
+        new = PricingEngine(**self.rules).price("OSAGO", 24, 2, "suv").total
+        self.assertEqual(result["ruleset_version"], "cand")
+        self.assertEqual((result["quotes"], result["skipped"], result["changed"], result["increased"]), (4, 0, 3, 3))
+        self.assertEqual(Decimal(result["delta"]["total"]), (new - old) * 3)
+        self.assertEqual(result["delta"]["p50"], f"{new - old:f}")
+        self.assertEqual(result["by_tariff"]["KASKO"]["delta_pct"], 0.0)
+        self.assertEqual(result["by_tariff"]["OSAGO"]["quotes"], 3)
+        # ни один расчёт не изменился
+        self.assertEqual(Quote.objects.filter(total_amount=new).count(), 0)
+
+    def test_filters_and_saved_ruleset(self):
+        result = self.simulate(ruleset="v1", tariff="KASKO").json()
+        self.assertEqual((result["quotes"], result["changed"]), (1, 0))
+        self.assertEqual(result["delta_pct"], 0.0)
+
+    def test_exactly_one_candidate_and_staff_only(self):
+        self.assertEqual(self.simulate(ruleset="v1", rules=self.rules).status_code, 400)
+        self.assertEqual(self.simulate(ruleset="nope").status_code, 400)
+        self.user.is_staff = False
+        self.user.save(update_fields=["is_staff"])
+        self.assertEqual(self.simulate(ruleset="v1").status_code, 403)
+
+
+class RollupTests(ApiTestCase):
+    def summary(self):
+        return self.client.get("/api/v1/summary/").json()
+
+    def test_counters_follow_create_expire_and_admin(self):
+        quotes = [self.create_quote(tariff=tariff) for tariff in ("OSAGO", "OSAGO", "KASKO")]
+        app = self.client.post("/api/v1/applications/", self.application(quotes[0]["id"]), format="json").json()
+        Quote.objects.filter(pk=quotes[1]["id"]).update(valid_until=timezone.now() - timedelta(days=1))
+        self.assertEqual(expiry.expire_quotes(chunk_size=1), 1)
+
+        request = APIRequestFactory().post("/")
+        request.user = self.user
+        application = Application.objects.get(pk=app["id"])
+        application.status = Application.Status.APPROVED
+        admin.site._registry[Application].save_model(request, application, None, change=True)
+        admin.site._registry[Quote].delete_queryset(request, Quote.objects.filter(pk=quotes[2]["id"]))
+
+        summary = self.summary()
+        by_status = {status: row["count"] for status, row in summary["quotes"]["by_status"].items()}
+        self.assertEqual(by_status, {"ACTIVE": 0, "USED": 1, "EXPIRED": 1})
+        self.assertEqual(summary["quotes"]["by_tariff"]["KASKO"]["count"], 0)
+        self.assertEqual(summary["applications"]["count"], 1)
+        self.assertEqual(summary["applications"]["by_status"]["APPROVED"]["count"], 1)
+        self.assertEqual(summary["applications"]["by_status"]["NEW"]["count"], 0)
+        kept = sum(Quote.objects.get(pk=quote["id"]).total_amount for quote in quotes[:2])
+        self.assertEqual(Decimal(summary["quotes"]["amount"]), kept)
+
+        # инкременты совпадают с пересчётом по таблицам
+        rollup.rebuild(self.user.id)
+        self.assertEqual(self.summary(), summary)
+
+
+class EventHubTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        quote = self.create_quote()
+        self.app_id = self.client.post("/api/v1/applications/", self.application(quote["id"]), format="json").json()["id"]
+        ApplicationEvent.objects.all().delete()
+        self.hub = events.EventHub()
+        self.subscription = events.Subscription(self.user.id)
+        self.hub._subscribers[self.user.id] = {self.subscription}
+
+    async def add(self, *ids, user_id=None):
+        for event_id in ids:
+            await ApplicationEvent.objects.acreate(
+                id=event_id, user_id=user_id or self.user.id, application_id=self.app_id, status="APPROVED",
+            )
+
+    async def poll(self):
+        await self.hub._poll()
+        return [event["id"] for event in await self.subscription.wait(0)]
+
+    async def test_late_commit_inside_gap_is_delivered(self):
+        # id 2 выдан, но его транзакция фиксируется после 3
+        await self.add(1, 3)
+        self.assertEqual(await self.poll(), [1, 3])
+        self.assertEqual((self.hub.last_id, set(self.hub._gaps)), (3, {2}))
+        await self.add(2)
+        self.assertEqual(await self.poll(), [2])
+        self.assertEqual(self.hub._gaps, {})
+        self.assertEqual(await self.poll(), [])
+
+    async def test_gap_is_given_up_after_timeout(self):
+        await self.add(1, 4)
+        self.assertEqual(await self.poll(), [1, 4])
+        later = time.monotonic() + events.GAP_SECONDS + 1
+        with mock.patch.object(events.time, "monotonic", return_value=later):
+            await self.add(2)
+            self.assertEqual(await self.poll(), [])
+        self.assertEqual(self.hub._gaps, {})
+
+    async def test_large_jump_is_not_a_gap(self):
+        await self.add(1, events.MAX_GAP + 2)
+        self.assertEqual(await self.poll(), [1, events.MAX_GAP + 2])
+        self.assertEqual(self.hub._gaps, {})
+
+    async def test_other_users_events_are_not_delivered(self):
+        other = await User.objects.acreate(username="other")
+        await self.add(1, user_id=other.id)
+        await self.add(2)
+        self.assertEqual(await self.poll(), [2])
+        self.assertEqual([e["id"] for e in await events.backlog(self.user.id, 0, 2)], [2])
+        self.assertEqual(await events.backlog(self.user.id, 2, 2), [])
+
+
+class ExportTests(ApiTestCase):
+    def test_csv_escapes_formulas_but_not_phones(self):
+        rows = [["+992 900 00-00-00", "-12.5", "+cmd|' /C calc'!A0", "-2+3", "=1+1", "@SUM(A1)", "\tx", 7]]
+        line = "".join(export.render_csv(["a"] * 8, rows)).splitlines()[1]
+        self.assertEqual(
+            line, "+992 900 00-00-00,-12.5,'+cmd|' /C calc'!A0,'-2+3,'=1+1,'@SUM(A1),'\tx,7",
+        )
+
+    def test_application_phone_exported_as_is(self):
+        quote = self.create_quote()
+        self.client.post("/api/v1/applications/", self.application(quote["id"]), format="json")
+        self.user.is_staff = True
+        self.user.save(update_fields=["is_staff"])
+        response = self.client.get("/api/v1/applications/export?fmt=csv")
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn(",+992900000000,", body)
+        self.assertNotIn("'+992", body)
+
+
+class RegistrationTests(ApiTestCase):
+    def register(self, username, email):
+        data = {"username": username, "email": email, "password": "long-pass-123"}
+        return self.client.post("/api/v1/auth/register/", data, format="json")
+
+    def test_taken_email_is_reported_on_email(self):
+        # username со словом email не путает поле
+        response = self.register("email_fan", "b@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["error"]["details"]), ["email"])
+        self.assertFalse(User.objects.filter(username="email_fan").exists())
+
+    def test_taken_username_is_reported_on_username(self):
+        User.objects.create_user("email_fan", email="f@example.com")
+        response = self.register("email_fan", "new@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["error"]["details"]), ["username"])
+
+    def test_postgres_error_is_mapped_by_constraint_name(self):
+        def error(constraint):
+            exc = IntegrityError(f'duplicate key value violates unique constraint "{constraint}"\n'
+                                 "DETAIL: Key (username)=(email_fan) already exists.")
+            exc.__cause__ = Exception()
+            exc.__cause__.diag = SimpleNamespace(constraint_name=constraint)  # как у psycopg
+            return exc
+        self.assertTrue(serializer._violated_email(error(serializer.EMAIL_CONSTRAINT)))
+        self.assertFalse(serializer._violated_email(error("auth_user_username_key")))
+
+    def test_new_user_is_created(self):
+        response = self.register("newbie", "n@example.com")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(User.objects.get(username="newbie").check_password("long-pass-123"))
+
+
+class ConnectionReportTests(SimpleTestCase):
+    databases = {"default"}
+
+    def report(self, deploy):
+        messages = run_checks(include_deployment_checks=deploy, databases=["default"])
+        return [m for m in messages if m.id == "bima.I001"]
+
+    def test_report_only_in_deploy_checks(self):
+        self.assertEqual(self.report(deploy=False), [])
+        report = self.report(deploy=True)
+        self.assertEqual(len(report), len(settings.DATABASES))
+        self.assertIn("health_checks=on", report[0].msg)
+        self.assertIn("journal_mode=WAL", report[0].msg)
+
+
+class CompactQuoteMigrationTests(TransactionTestCase):
+    # 0008–0010 переводят таблицу в компактный вид; ответ QuoteDetailSerializer
+    # после них и строка после отката до 0007 остаются прежними
+    before = [("bima", "0007_auth_user_email_uniq")]
+    after = [("bima", "0010_compact_quote_cutover")]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_detail_output_survives_migration_and_rollback(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old = executor.loader.project_state(self.before).apps
+        user = old.get_model("auth", "User").objects.create(username="m")
+        valid_until = timezone.now() + timedelta(days=1)
+        wide = {
+            "tariff": "KASKO", "driver_age": 30, "driver_experience": 5, "car_type": "suv",
+            "base_amount": Decimal("5000.00"), "coef_age": Decimal("1.000"), "coef_exp": Decimal("1.000"),
+            "coef_car": Decimal("1.150"), "total_amount": Decimal("5750.05"), "currency": "TJS",
+            "ruleset_version": "v2", "valid_until": valid_until, "status": "USED",
+        }
+        pk = old.get_model("bima", "Quote").objects.create(user=user, **wide).pk
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        models._factors_by_id.clear()
+        data = QuoteDetailSerializer(Quote.objects.get(pk=pk)).data
+        self.assertEqual(data, {
+            "id": str(pk), "tariff": "KASKO", "driver_age": 30, "driver_experience": 5, "car_type": "suv",
+            "base_amount": "5000.00", "coef_age": "1.000", "coef_exp": "1.000", "coef_car": "1.150",
+            "total_amount": "5750.05", "currency": "TJS", "ruleset_version": "v2",
+            "valid_until": serializers.DateTimeField().to_representation(valid_until), "status": "USED",
+            "created_at": data["created_at"],
+        })
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        row = old.get_model("bima", "Quote").objects.values(*wide).get(pk=pk)
+        self.assertEqual(row, wide)
@@ -0,0 +1,215 @@
+"""Ограничение частоты создания расчётов, заявок и регистраций.
+
+Скользящее окно из двух счётчиков: оценка числа запросов за последние
+duration секунд — счётчик текущего окна плюс доля предыдущего, пропорциональная
+его непрошедшей части. На ключ (scope, пользователь или IP) хранится O(1)
+данных, а не список отметок времени, как у SimpleRateThrottle DRF.
+
+Счётчики лежат либо в памяти процесса (LocalBackend, один узел), либо в общем
+кеше BIMA_THROTTLE_CACHE (CacheBackend: Redis/Memcached, atomic incr). Если
+общий кеш недоступен, запрос считается по счётчикам процесса, а не падает.
+Лимиты — DEFAULT_THROTTLE_RATES, для тарифов брокеров (claim tier в токене) —
+BIMA_THROTTLE_TIERS.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+QUOTES, APPLICATIONS, REGISTER = "quotes", "applications", "register"
+DEFAULT_TIER = "default"
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate):
+    # "120/min" -> (120, 60); None — без ограничения
+    if not rate:
+        return None
+    count, period = rate.split("/")
+    return int(count), DURATIONS[period[0]]
+
+
+def _estimate(previous, current, elapsed, duration):
+    return previous * (1 - elapsed / duration) + current
+
+
+def _wait(previous, current, limit, elapsed, duration):
+    # через сколько секунд оценка опустится ниже limit
+    if current >= limit or not previous:
+        return duration - elapsed
+    return max(duration * (1 - (limit - current) / previous) - elapsed, 0)
+
+
+class LocalBackend:
+    # счётчики в памяти процесса; SHARDS словарей со своими блокировками,
+    # чтобы потоки воркера не ждали друг друга на одном lock
+    SHARDS = 16
+    MAX_KEYS = 50_000  # на шард; сверх — выбрасываются ключи с истёкшими окнами
+
+    def __init__(self):
+        self._shards = [(threading.Lock(), {}) for _ in range(self.SHARDS)]
+
+    def hit(self, key, limit, duration, now):
+        # None — запрос пропущен и учтён; иначе — сколько секунд ждать
+        window = int(now // duration)
+        elapsed = now - window * duration
+        lock, counters = self._shards[hash(key) % self.SHARDS]
+        with lock:
+            state = counters.get(key)  # [окно, предыдущее, текущее, когда перестаёт влиять]
+            if state is None:
+                if len(counters) >= self.MAX_KEYS:
+                    self._evict(counters, now)
+                state = counters[key] = [window, 0, 0, 0]
+            elif state[0] != window:
+                state[1] = state[2] if state[0] == window - 1 else 0
+                state[0], state[2] = window, 0
+            if _estimate(state[1], state[2] + 1, elapsed, duration) > limit:
+                return _wait(state[1], state[2], limit, elapsed, duration)
+            state[2] += 1
+            state[3] = (window + 2) * duration
+        return None
+
+    async def ahit(self, key, limit, duration, now):
+        return self.hit(key, limit, duration, now)
+
+    def _evict(self, counters, now):
+        for key in [key for key, state in counters.items() if state[3] <= now]:
+            del counters[key]
+        if len(counters) >= self.MAX_KEYS:
+            counters.clear()
+
+
+class CacheBackend:
+    # общий для узлов кеш: ключ на окно, incr атомарен в Redis/Memcached;
+    # отказ кеша — счёт по LocalBackend этого процесса
+    def __init__(self, alias, fallback):
+        self.alias = alias
+        self.fallback = fallback
+        self._warned = 0.0
+
+    def _keys(self, key, window, duration):
+        return f"thr:{key}:{duration}:{window}", f"thr:{key}:{duration}:{window - 1}"
+
+    def _failed(self):
+        if time.monotonic() - self._warned > 60:
+            self._warned = time.monotonic()
+            logger.warning("throttle cache %r unavailable, counting in-process", self.alias, exc_info=True)
+
+    def hit(self, key, limit, duration, now):
+        window = int(now // duration)
+        elapsed = now - window * duration
+        current_key, previous_key = self._keys(key, window, duration)
+        cache = caches[self.alias]
+        try:
+            try:
+                current = cache.incr(current_key)
+            except ValueError:
+                # первое обращение в окне; add проиграл гонку — ключ уже есть
+                current = 1 if cache.add(current_key, 1, 2 * duration) else cache.incr(current_key)
+            previous = cache.get(previous_key, 0)
+            if _estimate(previous, current, elapsed, duration) > limit:
+                cache.decr(current_key)  # отклонённый запрос не расходует лимит
+                return _wait(previous, current - 1, limit, elapsed, duration)
+        except Exception:
+            self._failed()
+            return self.fallback.hit(key, limit, duration, now)
+        return None
+
+    async def ahit(self, key, limit, duration, now):
+        window = int(now // duration)
+        elapsed = now - window * duration
+        current_key, previous_key = self._keys(key, window, duration)
+        cache = caches[self.alias]
+        try:
+            try:
+                current = await cache.aincr(current_key)
+            except ValueError:
+                current = 1 if await cache.aadd(current_key, 1, 2 * duration) else await cache.aincr(current_key)
+            previous = await cache.aget(previous_key, 0)
+            if _estimate(previous, current, elapsed, duration) > limit:
+                await cache.adecr(current_key)
+                return _wait(previous, current - 1, limit, elapsed, duration)
+        except Exception:
+            self._failed()
+            return self.fallback.hit(key, limit, duration, now)
+        return None
+
+
+_local = LocalBackend()
+_backends = {}
+
+
+def backend():
+    alias = settings.BIMA_THROTTLE_CACHE
+    if not alias:
+        return _local
+    if alias not in _backends:
+        _backends[alias] = CacheBackend(alias, _local)
+    return _backends[alias]
+
+
+def tier_of(request):
+    # claim tier ставит ClaimsRefreshToken.for_user; старые токены — DEFAULT_TIER
+    token = getattr(request, "auth", None)
+    return (token.get("tier") if token is not None else None) or DEFAULT_TIER
+
+
+def user_tier(user):
+    # тариф брокера — группа пользователя с именем из BIMA_THROTTLE_TIERS
+    if not settings.BIMA_THROTTLE_TIERS:
+        return DEFAULT_TIER
+    return user.groups.filter(name__in=list(settings.BIMA_THROTTLE_TIERS)).values_list("name", flat=True).first() \
+        or DEFAULT_TIER
+
+
+def _target(request, scope):
+    # (ключ, лимит, длительность окна) или None, если scope не ограничен
+    tier = tier_of(request)
+    rate = settings.BIMA_THROTTLE_TIERS.get(tier, {}).get(scope, api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+    parsed = parse_rate(rate)
+    if parsed is None:
+        return None
+    user = request.user
+    ident = f"u{user.pk}" if user and user.is_authenticated else f"ip{BaseThrottle().get_ident(request)}"
+    return (f"{scope}:{ident}", *parsed)
+
+
+def check(request, scope):
+    target = _target(request, scope)
+    if target is not None:
+        wait = backend().hit(*target, time.time())
+        if wait is not None:
+            raise exceptions.Throttled(wait)
+
+
+async def acheck(request, scope):
+    target = _target(request, scope)
+    if target is not None:
+        wait = await backend().ahit(*target, time.time())
+        if wait is not None:
+            raise exceptions.Throttled(wait)
+
+
+class CreateRateThrottle(BaseThrottle):
+    # только POST (создание) по view.throttle_scope; чтение не ограничивается
+    def allow_request(self, request, view):
+        self._wait = None
+        if request.method != "POST":
+            return True
+        target = _target(request, view.throttle_scope)
+        if target is None:
+            return True
+        self._wait = backend().hit(*target, time.time())
+        return self._wait is None
+
+    def wait(self):
+        return self._wait
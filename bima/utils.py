@@ -1,7 +1,16 @@
 from dataclasses import dataclass
+from decimal import Decimal
 
 RULESET_VERSION = "v1"
 QUOTE_TTL_DAYS = 7
+EXPIRY_CHUNK_SIZE = 1000  # строк в одном UPDATE/DELETE при чистке просроченных
+QUOTE_BATCH_MAX = 5000  # максимум позиций в POST /quotes/batch/
+PREVIEW_CACHE_SIZE = 8192  # записей в LRU для GET /quotes/preview/ (на процесс)
+CURRENCY = "TJS"
+
+# допустимые значения входных параметров калькулятора
+AGE_MIN, AGE_MAX = 18, 100
+EXP_MIN, EXP_MAX = 0, 80
 
 BASE_PRICES = {"OSAGO": 1000, "KASKO": 5000}  # валюта — TJS
 
@@ -28,10 +37,10 @@ def pick_from_ranges(value: int, ranges: list[tuple[int, int, float]]) -> float:
     return 1.0
 
 
-@dataclass
+@dataclass(frozen=True)
 class Calculated:
-    base: float
-    c_age: float
-    c_exp: float
-    c_car: float
-    total: float
+    base: Decimal
+    c_age: Decimal
+    c_exp: Decimal
+    c_car: Decimal
+    total: Decimal
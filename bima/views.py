@@ -1,36 +1,113 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.shortcuts import render
 from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 #
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import permissions, status , generics
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from . import etags, throttling
+from .authentication import ClaimsRefreshToken
+from .etags import ConditionalRetrieveMixin
+from .export import CONTENT_TYPES, RENDERERS, aiterate, export_rows
+from .filters import ListFilterBackend, filter_by
+from .idempotency import IdempotentCreateMixin
+from .metrics import render_prometheus
 from .models import Quote, Application
+from .pagination import KeysetPagination
+from .permission import IsStaffOrMetricsToken
+from .replicas import ReplicaReadMixin, pick_replica
+from .rollup import summary_for
+from .simulate import simulate
+from .throttling import CreateRateThrottle
 from .serializer import (
-    QuoteCreateSerializer, QuoteDetailSerializer,
-    ApplicationCreateSerializer, ApplicationDetailSerializer,
-    RegisterSerializer, RegisterResponseSerializer
+    QuoteCreateSerializer, QuoteDetailSerializer, QuoteListSerializer, QuoteBatchSerializer,
+    QuotePreviewSerializer, preview_data,
+    QuoteFilterSerializer, ApplicationFilterSerializer, SimulationSerializer,
+    ApplicationCreateSerializer, ApplicationDetailSerializer, ApplicationListSerializer,
+    RegisterSerializer, RegisterResponseSerializer, SummarySerializer,
 )
 
-class QuoteViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+# в схеме список описан detail-сериализатором: формат ответа тот же
+@extend_schema_view(list=extend_schema(responses=QuoteDetailSerializer))
+class QuoteViewSet(ReplicaReadMixin, ConditionalRetrieveMixin, IdempotentCreateMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    filter_backends = [ListFilterBackend]
+    filter_serializer_class = QuoteFilterSerializer
+    etag_kind = etags.QUOTE
+    throttle_classes = [CreateRateThrottle]
+    throttle_scope = throttling.QUOTES
     def get_queryset(self):
-        return Quote.objects.filter(user=self.request.user).order_by("-created_at")
+        queryset = Quote.objects.filter(user_id=self.request.user.id).order_by("-created_at", "-id")
+        # список — строки values() для QuoteListSerializer, без модельных объектов
+        return QuoteListSerializer.values(queryset) if self.action == "list" else queryset
     def get_serializer_class(self):
+        if self.action == "list":
+            return QuoteListSerializer
+        if self.action == "batch":
+            return QuoteBatchSerializer
+        if self.action == "preview":
+            return QuotePreviewSerializer
         return QuoteCreateSerializer if self.action == "create" else QuoteDetailSerializer
 
-class ApplicationViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    @extend_schema(parameters=[QuotePreviewSerializer], responses={200: QuotePreviewSerializer})
+    @action(detail=False, methods=["get"])
+    def preview(self, request):
+        # расчёт без сохранения: ответ берётся из LRU в памяти, БД не трогаем
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(preview_data(serializer.validated_data))
+
+    @extend_schema(request=QuoteBatchSerializer, responses={201: dict, 400: dict})
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        # пакетный расчёт: одна валидация на позицию, один bulk_create на весь пакет
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = serializer.save()
+        code = status.HTTP_201_CREATED if result["created"] else status.HTTP_400_BAD_REQUEST
+        return Response(result, status=code)
+
+@extend_schema_view(list=extend_schema(responses=ApplicationDetailSerializer))
+class ApplicationViewSet(ReplicaReadMixin, ConditionalRetrieveMixin, IdempotentCreateMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    filter_backends = [ListFilterBackend]
+    filter_serializer_class = ApplicationFilterSerializer
+    etag_kind = etags.APPLICATION
+    throttle_classes = [CreateRateThrottle]
+    throttle_scope = throttling.APPLICATIONS
     def get_queryset(self):
-        return Application.objects.filter(user=self.request.user).order_by("-created_at")
+        queryset = Application.objects.filter(user_id=self.request.user.id).order_by("-created_at", "-id")
+        if self.action == "list":
+            return ApplicationListSerializer.values(queryset)
+        return queryset.select_related("user")
     def get_serializer_class(self):
+        if self.action == "list":
+            return ApplicationListSerializer
         return ApplicationCreateSerializer if self.action == "create" else ApplicationDetailSerializer
 
+class SummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses=SummarySerializer)
+    def get(self, request):
+        # счётчики и суммы своих расчётов и заявок по статусам и тарифам — из таблицы Summary
+        return Response(SummarySerializer(summary_for(request.user.id)).data)
+
+
 @extend_schema(auth=[], tags=["auth"])
 class RegisterView(generics.CreateAPIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [CreateRateThrottle]
+    throttle_scope = throttling.REGISTER
     serializer_class = RegisterSerializer
 
     @extend_schema(
@@ -42,11 +119,68 @@ class RegisterView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
-        return Response({
-            "id": user.id,
-            "username": user.get_username(),
-            "email": user.email,
-            "access": str(refresh.access_token),
-            "refresh": str(refresh),
-        }, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(registration_data(user), status=status.HTTP_201_CREATED)
+
+
+def registration_data(user):
+    # только что созданный пользователь ни в одной группе — тариф без запроса к БД
+    refresh = ClaimsRefreshToken.for_user(user, tier=throttling.DEFAULT_TIER)
+    return {
+        "id": user.id,
+        "username": user.get_username(),
+        "email": user.email,
+        "access": str(refresh.access_token),
+        "refresh": str(refresh),
+    }
+
+
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    permission_classes = [IsStaffOrMetricsToken]
+
+    def get(self, request):
+        # гистограммы этого процесса в текстовом формате Prometheus
+        return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@extend_schema(exclude=True)
+class ExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    kind = None  # "quotes" | "applications", задаётся в as_view()
+
+    def get(self, request):
+        # поток CSV/NDJSON: фильтры как у списка (tariff, status, created_from/created_to),
+        # формат — ?fmt=csv|ndjson (не ?format: его занимает DRF)
+        fmt = request.query_params.get("fmt", "csv")
+        if fmt not in RENDERERS:
+            raise ValidationError({"fmt": f"ожидается одно из: {', '.join(RENDERERS)}"})
+        columns, rows = export_rows(
+            self.kind, request.query_params, settings.BIMA_EXPORT_CHUNK_SIZE, using=pick_replica(),
+        )
+        chunks = RENDERERS[fmt](columns, rows)
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+        stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+        response["Content-Disposition"] = f'attachment; filename="{self.kind}-{stamp}.{fmt}"'
+        return response
+
+
+@extend_schema(exclude=True)
+class SimulateView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        # what-if: пересчёт сохранённых расчётов правилами-кандидатом, только агрегаты;
+        # фильтры — как у списка расчётов, но в теле запроса
+        serializer = SimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        queryset = filter_by(Quote.objects.using(pick_replica()), data)
+        return Response(simulate(queryset, data["engine"]))
+
+
+@extend_schema(exclude=True)
+class ApplicationEventsView(APIView):
+    # GET обслуживает async_views.application_events; здесь — остальные методы (405)
+    pass